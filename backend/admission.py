@@ -0,0 +1,146 @@
+import logging
+import math
+import threading
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+ADMISSION_IN_FLIGHT = Gauge('cloudpose_admission_in_flight', 'Requests currently admitted to inference',
+                            multiprocess_mode='livesum')
+ADMISSION_QUEUE_DEPTH = Gauge('cloudpose_admission_queue_depth', 'Requests waiting for admission',
+                              multiprocess_mode='livesum')
+ADMISSION_SHED = Counter('cloudpose_admission_shed_total', 'Requests rejected by admission control', ['reason'])
+ADMISSION_WAIT = Histogram(
+    'cloudpose_admission_wait_seconds',
+    'Time admitted requests waited in the admission queue',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+# Weight of the latest request in the moving average of service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; retry_after is the suggested delay in whole seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Request rejected ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded admission queue in front of inference
+
+    At most max_concurrency requests run at once and at most max_queue wait
+    behind them. A request is rejected up front when the queue is full or
+    when its estimated wait (queue position times the moving average service
+    time) exceeds max_wait seconds, and while queued once it has waited
+    max_wait. Rejections carry a Retry-After estimate of when the current
+    backlog will have drained. Requests may take several slots (a weight),
+    e.g. one per image of a batch, capped at max_concurrency.
+    """
+
+    def __init__(self, max_concurrency, max_queue, max_wait, initial_service_time=0.1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.service_time = initial_service_time
+
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def queued(self):
+        return self._waiting
+
+    def estimated_wait(self, position=None):
+        """Expected wait in seconds for a request joining the queue at position (default: the end)"""
+        if position is None:
+            if self._in_flight < self.max_concurrency and not self._waiting:
+                return 0.0
+            position = self._waiting + 1
+        return position / self.max_concurrency * self.service_time
+
+    def saturated(self):
+        """Whether a new request would be shed right now (queue full or wait over max_wait)"""
+        if self._in_flight < self.max_concurrency and not self._waiting:
+            return False
+        return self._waiting >= self.max_queue or self.estimated_wait() > self.max_wait
+
+    def _retry_after(self):
+        return max(1, math.ceil(self.estimated_wait()))
+
+    def _reject(self, reason):
+        retry_after = self._retry_after()
+        ADMISSION_SHED.labels(reason=reason).inc()
+        raise AdmissionRejected(reason, retry_after)
+
+    def _slots(self, weight):
+        return min(max(1, weight), self.max_concurrency)
+
+    def acquire(self, timeout=None, weight=1):
+        """Wait for weight admission slots; returns a ticket for release()
+
+        timeout lowers the longest acceptable wait for this request (e.g. the
+        time left before its deadline). Raises AdmissionRejected when the
+        request is shed.
+        """
+        arrived = time.time()
+        max_wait = self.max_wait if timeout is None else min(self.max_wait, timeout)
+        slots = self._slots(weight)
+        with self._cond:
+            if self._in_flight + slots > self.max_concurrency or self._waiting:
+                if self._waiting >= self.max_queue:
+                    self._reject('queue_full')
+                if self.estimated_wait() > max_wait:
+                    self._reject('estimated_wait')
+
+                self._waiting += 1
+                ADMISSION_QUEUE_DEPTH.set(self._waiting)
+                try:
+                    deadline = arrived + max_wait
+                    while self._in_flight + slots > self.max_concurrency:
+                        remaining = deadline - time.time()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            if self._in_flight + slots > self.max_concurrency:
+                                self._reject('timeout')
+                finally:
+                    self._waiting -= 1
+                    ADMISSION_QUEUE_DEPTH.set(self._waiting)
+
+            self._in_flight += slots
+            ADMISSION_IN_FLIGHT.set(self._in_flight)
+
+        admitted = time.time()
+        ADMISSION_WAIT.observe(admitted - arrived)
+        return admitted
+
+    def release(self, ticket, weight=1):
+        """Free the slots taken by acquire() and update the service time estimate"""
+        service_time = time.time() - ticket
+        with self._cond:
+            self.service_time += SERVICE_TIME_SMOOTHING * (service_time - self.service_time)
+            self._in_flight -= self._slots(weight)
+            ADMISSION_IN_FLIGHT.set(self._in_flight)
+            # Waiters need different numbers of slots, so let each one check
+            self._cond.notify_all()
+
+    def status(self):
+        return {
+            'in_flight': self._in_flight,
+            'queued': self._waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'service_time': round(self.service_time, 6),
+            'estimated_wait': round(self.estimated_wait(), 6),
+            'saturated': self.saturated()
+        }
@@ -1,4 +1,10 @@
-from flask import Flask, request, jsonify
+import cpu_config
+
+# Size the OpenMP/BLAS thread pools from the container's CPU quota before
+# NumPy and OpenCV are loaded
+THREAD_CONFIG = cpu_config.configure_threads()
+
+from flask import Flask, request, jsonify, g, has_request_context
 import json
 import base64
 import io
@@ -6,31 +12,177 @@ import logging
 import time
 from PIL import Image
 import numpy as np
-import tensorflow.lite as tflite
 import cv2
 import os
+import math
 import traceback
+import functools
+import hmac
+import threading
 from datetime import datetime
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, multiprocess, \
+    CONTENT_TYPE_LATEST
 import psutil
-import threading
+from interpreter_pool import InterpreterPool, PoolTimeout, available_cpu_count
+from batching import MicroBatcher, supported_batch_sizes
+from result_cache import PoseResultCache, content_key
+from singleflight import SingleFlight, SingleFlightTimeout
+from postprocess import persons_from_keypoints, serialize_persons
+from multiperson import TILE_SCALES, merge_crop_detections, plan_crops
+from model_selector import FULL, LIGHT, MODEL_INFERENCES, LoadAwareSelector
+from admission import AdmissionController, AdmissionRejected
+from deadline import DEADLINE_EXCEEDED, Deadline, DeadlineExceeded, RequestAbandoned, socket_disconnected
+from runtime import current_rss, load_runtime, record_startup_phase, record_warm_up, startup_phases
+from health import READY, SystemSampler, start_probe_server
+from profiler import CPROFILE, SAMPLE, ProfilingSession
+from model_report import BUILTIN, OP_RESOLVERS, XNNPACK, check_delegation, format_report, model_report
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keep OpenCV's internal thread pool within this process's CPU share
+cv2.setNumThreads(THREAD_CONFIG['opencv_threads'])
+
 app = Flask(__name__)
 
 # Prometheus monitoring metrics
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
 REQUEST_COUNT = Counter('cloudpose_requests_total', 'Total requests', ['method', 'endpoint'])
-REQUEST_DURATION = Histogram('cloudpose_request_duration_seconds', 'Request duration')
+REQUEST_DURATION = Histogram('cloudpose_request_duration_seconds', 'Request duration, admission wait included',
+                             ['endpoint'], buckets=LATENCY_BUCKETS)
+STAGE_DURATION = Histogram('cloudpose_request_stage_seconds',
+                           'Time requests spent per processing stage (parse, queue, decode, pool, inference, '
+                           'render, serialize)',
+                           ['endpoint', 'stage'], buckets=LATENCY_BUCKETS)
+PAYLOAD_SIZE = Histogram('cloudpose_request_payload_bytes', 'Size of request bodies', ['endpoint'],
+                         buckets=(1024, 10240, 51200, 102400, 262144, 524288, 1048576, 2097152, 4194304, 8388608,
+                                  16777216, 33554432))
+IMAGE_MEGAPIXELS = Histogram('cloudpose_image_megapixels', 'Resolution of decoded input images in megapixels',
+                             buckets=(0.1, 0.3, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 12.0, 16.0, 24.0, 50.0))
 POSE_DETECTION_COUNT = Counter('cloudpose_pose_detections_total', 'Total pose detections')
 ERROR_COUNT = Counter('cloudpose_errors_total', 'Total errors', ['error_type'])
+PROCESS_MEMORY = Gauge('cloudpose_process_memory_bytes', 'Memory used by this worker process', ['type'],
+                       multiprocess_mode='liveall')
 
 # Global variables for model storage
-interpreter = None
+runtime = None
+model_load_stats = None
+interpreter_pool = None
+batcher = None
 model_loaded = False
-model_lock = threading.Lock()  # Thread lock to protect model access
+model_warm = False
+
+# Lighter model variant served while the service is overloaded
+light_pool = None
+light_batcher = None
+model_selector = None
+model_names = {FULL: None, LIGHT: None}
+
+# Inference runtime: auto (LiteRT, then tflite_runtime, then full TensorFlow), litert,
+# tflite_runtime, tensorflow, onnx (picked automatically for .onnx models) or stub (no
+# model file needed, see runtime.StubInterpreter)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'auto').lower()
+
+# Interpreter pool configuration (0 = one interpreter per available core)
+INTERPRETER_POOL_SIZE = int(os.environ.get('INTERPRETER_POOL_SIZE', '0'))
+INTERPRETER_CHECKOUT_TIMEOUT = float(os.environ.get('INTERPRETER_CHECKOUT_TIMEOUT', '30'))
+# Threads used inside each interpreter (0 = split this process's cores across the pool)
+TFLITE_NUM_THREADS = int(os.environ.get('TFLITE_NUM_THREADS', '0'))
+
+# Load-aware degradation: switch to LIGHT_MODEL_PATH (e.g. MoveNet Lightning 192) when
+# DEGRADE_QUEUE_DEPTH requests wait for admission or an interpreter (0 = twice the pool size)
+# or the recent p95, admission wait included, reaches DEGRADE_P95_MS; an empty path disables it
+LIGHT_MODEL_PATH = os.environ.get('LIGHT_MODEL_PATH', '')
+DEGRADE_QUEUE_DEPTH = int(os.environ.get('DEGRADE_QUEUE_DEPTH', '0'))
+DEGRADE_P95_MS = float(os.environ.get('DEGRADE_P95_MS', '500'))
+DEGRADE_MIN_SECONDS = float(os.environ.get('DEGRADE_MIN_SECONDS', '5'))
+DEGRADE_WINDOW_SECONDS = float(os.environ.get('DEGRADE_WINDOW_SECONDS', '10'))
+
+# Micro-batching configuration
+BATCHING_ENABLED = os.environ.get('BATCHING_ENABLED', 'false').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', '5'))
+
+# Pose result cache configuration (0 bytes disables the cache, 0 TTL never expires)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '0'))
+result_cache = PoseResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS) if RESULT_CACHE_MAX_BYTES > 0 else None
+
+# Coalesce concurrent inferences of identical images (independent of the result cache)
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+inflight_inferences = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+
+# Decode JPEGs at the smallest DCT scale that still covers the model input
+REDUCED_DECODE_ENABLED = os.environ.get('REDUCED_DECODE_ENABLED', 'true').lower() == 'true'
+
+# Multi-person crop cascade: default mode and upper bound on crops per request
+MULTI_PERSON_DEFAULT = os.environ.get('MULTI_PERSON_DEFAULT', 'false').lower() == 'true'
+MULTI_PERSON_MAX_CROPS = int(os.environ.get('MULTI_PERSON_MAX_CROPS', '9'))
+
+# Warm-up before reporting ready: WARMUP_ITERATIONS synthetic inferences per interpreter
+# (0 = skip) at every batch size requests can use, or the sizes listed in WARMUP_BATCH_SIZES
+WARMUP_ITERATIONS = int(os.environ.get('WARMUP_ITERATIONS', '2'))
+WARMUP_BATCH_SIZES = os.environ.get('WARMUP_BATCH_SIZES', '')
+
+# Annotated image output defaults (overridable per request)
+IMAGE_FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+    'png': ('.png', 'image/png')
+}
+ANNOTATED_IMAGE_FORMAT = os.environ.get('ANNOTATED_IMAGE_FORMAT', 'jpeg').lower()
+ANNOTATED_IMAGE_QUALITY = int(os.environ.get('ANNOTATED_IMAGE_QUALITY', '95'))
+ANNOTATED_IMAGE_MAX_DIMENSION = int(os.environ.get('ANNOTATED_IMAGE_MAX_DIMENSION', '0'))
+ANNOTATED_IMAGE_PNG_COMPRESSION = int(os.environ.get('ANNOTATED_IMAGE_PNG_COMPRESSION', '1'))
+
+# Admission control in front of inference: at most ADMISSION_MAX_CONCURRENCY images are
+# inferred at once (0 = interpreter pool size, times BATCH_MAX_SIZE with micro-batching)
+# and ADMISSION_MAX_QUEUE requests wait (0 = four per slot); requests that would wait
+# longer than ADMISSION_MAX_WAIT_MS get 429 with Retry-After. Cache hits skip the queue
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '0')) \
+    or (INTERPRETER_POOL_SIZE or available_cpu_count()) * (BATCH_MAX_SIZE if BATCHING_ENABLED else 1)
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '0')) or 4 * ADMISSION_MAX_CONCURRENCY
+ADMISSION_MAX_WAIT_MS = float(os.environ.get('ADMISSION_MAX_WAIT_MS', '2000'))
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_WAIT_MS / 1000.0
+) if ADMISSION_ENABLED else None
+
+# Deadline applied to requests that don't send one (0 = none), and abandoning
+# requests whose client disconnected
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get('REQUEST_TIMEOUT_SECONDS', '0'))
+DISCONNECT_DETECTION_ENABLED = os.environ.get('DISCONNECT_DETECTION_ENABLED', 'true').lower() == 'true'
+
+# Health probes: system stats are sampled in the background every HEALTH_SAMPLE_INTERVAL
+# seconds, and PROBE_PORT (0 = off) serves /live and /ready from a thread of their own
+HEALTH_SAMPLE_INTERVAL = float(os.environ.get('HEALTH_SAMPLE_INTERVAL', '5'))
+PROBE_PORT = int(os.environ.get('PROBE_PORT', '0'))
+
+# On-demand profiling at POST /debug/profile and the model report at /debug/model,
+# enabled by setting PROFILING_TOKEN (sent in X-Profiling-Token); a profiling session
+# lasts at most PROFILING_MAX_SECONDS
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_MAX_SECONDS = float(os.environ.get('PROFILING_MAX_SECONDS', '60'))
+profiling_session = None
+profiling_lock = threading.Lock()
+
+# Hot path functions reported individually by the profiler
+HOT_PATH_FUNCTIONS = (
+    'decode_base64_payload', 'decode_image_bytes', 'decode_base64_image', 'detect_persons', 'detect_persons_multi',
+    'preprocess_image', 'predict_pose_single', 'run_batch_inference', 'draw_pose_on_image', 'encode_image',
+    'encode_image_to_base64', 'serialize_persons', 'json_response'
+)
+
+# Batch endpoint configuration (0 decode workers = one per available core)
+BATCH_ENDPOINT_MAX_ITEMS = int(os.environ.get('BATCH_ENDPOINT_MAX_ITEMS', '64'))
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', '0'))
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS or available_cpu_count(),
+                                     thread_name_prefix='decode')
 
 # MoveNet keypoint names
 KEYPOINT_NAMES = [
@@ -53,37 +205,293 @@ CONNECTION_COLOR = (255, 0, 0)  # Blue
 BOX_COLOR = (0, 0, 255)  # Red
 
 def load_model():
-    """Load MoveNet model"""
-    global interpreter, model_loaded
+    """Load MoveNet model into a pool of interpreters"""
+    global interpreter_pool, batcher, model_loaded, model_warm, light_pool, light_batcher, model_selector
+    global runtime, model_load_stats
+    model_warm = False
     try:
         # Prioritize environment variable, otherwise use default container path
         model_path = os.environ.get('MODEL_PATH', '/app/model/movenet-full-256.tflite')
-        if not os.path.exists(model_path):
+        if not os.path.exists(model_path) and INFERENCE_BACKEND != 'stub':
             logger.error(f"Model file not found: {model_path}")
             return False
-            
-        interpreter = tflite.Interpreter(model_path=model_path)
-        interpreter.allocate_tensors()
+        
+        # Import the inference runtime once per process
+        if runtime is None:
+            backend = INFERENCE_BACKEND
+            if backend == 'auto' and model_path.endswith('.onnx'):
+                backend = 'onnx'
+            runtime = load_runtime(backend)
+        load_start = time.time()
+        rss_before = current_rss()
+        
+        pool_size = INTERPRETER_POOL_SIZE or available_cpu_count()
+        num_threads = TFLITE_NUM_THREADS or max(1, cpu_config.process_cpus() // pool_size)
+        cpu_config.set_thread_setting(THREAD_CONFIG, 'tflite_threads', num_threads)
+        interpreter_pool = InterpreterPool(
+            lambda: runtime.create_interpreter(model_path, num_threads),
+            pool_size
+        )
+        batcher = create_batcher(interpreter_pool)
+        model_names[FULL] = model_name(model_path)
+        with interpreter_pool.checkout() as interpreter:
+            check_delegation(model_names[FULL], interpreter)
+        
+        # Optional light variant for load-aware degradation
+        light_pool = light_batcher = model_selector = None
+        if LIGHT_MODEL_PATH:
+            if os.path.exists(LIGHT_MODEL_PATH) or INFERENCE_BACKEND == 'stub':
+                light_pool = InterpreterPool(
+                    lambda: runtime.create_interpreter(LIGHT_MODEL_PATH, num_threads),
+                    pool_size,
+                    report_metrics=False
+                )
+                light_batcher = create_batcher(light_pool)
+                model_names[LIGHT] = model_name(LIGHT_MODEL_PATH)
+                with light_pool.checkout() as interpreter:
+                    check_delegation(model_names[LIGHT], interpreter)
+                model_selector = LoadAwareSelector(
+                    DEGRADE_QUEUE_DEPTH or 2 * pool_size,
+                    DEGRADE_P95_MS / 1000.0,
+                    min_dwell=DEGRADE_MIN_SECONDS,
+                    window=DEGRADE_WINDOW_SECONDS
+                )
+                logger.info(f"Light model {model_names[LIGHT]} loaded for load-aware degradation")
+            else:
+                logger.warning(f"Light model not found: {LIGHT_MODEL_PATH}, load-aware degradation disabled")
+        
+        # Tensor allocation is reported as its own phase
+        allocate_seconds = sum(pool.allocate_seconds for pool in (interpreter_pool, light_pool) if pool is not None)
+        model_load_stats = {
+            'seconds': time.time() - load_start - allocate_seconds,
+            'allocate_seconds': allocate_seconds,
+            'rss_bytes': current_rss() - rss_before
+        }
+        record_startup_phase('model_load', model_load_stats['seconds'], model_load_stats['rss_bytes'])
+        record_startup_phase('allocate', allocate_seconds)
+        
         model_loaded = True
-        logger.info("MoveNet model loaded successfully")
+        logger.info(f"MoveNet model loaded successfully with {runtime.name} ({pool_size} interpreters, "
+                    f"load {model_load_stats['seconds']:.3f}s, allocate {allocate_seconds:.3f}s, "
+                    f"+{model_load_stats['rss_bytes'] / 2**20:.1f}MiB RSS)")
         return True
     except Exception as e:
         logger.error(f"Failed to load model: {e}")
         model_loaded = False
         return False
 
-def decode_base64_image(base64_string):
-    """Decode base64 image data"""
+def model_name(model_path):
+    """Name a model variant is reported under (the model file name without extension)"""
+    return os.path.splitext(os.path.basename(model_path))[0]
+
+def model_variant(variant=FULL):
+    """Return the (pool, batcher) serving a model variant"""
+    if variant == LIGHT and light_pool is not None:
+        return light_pool, light_batcher
+    return interpreter_pool, batcher
+
+def inference_queue_depth():
+    """Number of requests waiting for admission or an interpreter across all model variants"""
+    depth = admission.queued if admission is not None else 0
+    for pool, variant_batcher in ((interpreter_pool, batcher), (light_pool, light_batcher)):
+        if pool is not None:
+            depth += pool.waiting
+        if variant_batcher is not None:
+            depth += variant_batcher.queue_depth
+    return depth
+
+def select_model():
+    """Pick the model variant for a new request from the current load"""
+    if model_selector is None:
+        return FULL
+    return model_selector.select(inference_queue_depth())
+
+def record_inference(variant, latency, count=1, waited=0.0):
+    """Count inferences per variant and feed their latency to the model selector
+    
+    waited is the request's admission wait, which the selector counts as part
+    of the latency so queueing in front of inference triggers degradation too.
+    """
+    MODEL_INFERENCES.labels(model=variant).inc(count)
+    if model_selector is not None:
+        model_selector.observe(waited + latency)
+
+def create_batcher(pool):
+    """Start the micro-batching scheduler for a pool, if batching is enabled"""
+    if not BATCHING_ENABLED:
+        return None
+    return MicroBatcher(
+        pool,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait=BATCH_MAX_WAIT_MS / 1000.0,
+        checkout_timeout=INTERPRETER_CHECKOUT_TIMEOUT
+    )
+
+def warm_up_batch_sizes():
+    """Batch dimensions the interpreters can be invoked with"""
+    if WARMUP_BATCH_SIZES:
+        return sorted({int(size) for size in WARMUP_BATCH_SIZES.split(',') if size.strip()})
+    # Single images, plus micro-batches (padded to the supported sizes) when
+    # batching is on and crop batches (one per crop count) when requests are
+    # multi-person by default. Each size grows every interpreter's arena, so
+    # occasional batch endpoint or opt-in multi-person requests pay for their
+    # size on first use instead
+    sizes = {1}
+    if BATCHING_ENABLED:
+        sizes.update(supported_batch_sizes(BATCH_MAX_SIZE))
+    if MULTI_PERSON_DEFAULT:
+        sizes.update(range(1, MULTI_PERSON_MAX_CROPS + 1))
+    return sorted(sizes)
+
+def warm_up_model():
+    """Run synthetic inputs through every interpreter before the service reports ready
+    
+    Each model variant is warmed at its own input shape and at every batch
+    size, so the first real requests run at steady-state latency instead of
+    paying for delegate setup and tensor arena growth.
+    """
+    global model_warm
+    if not model_loaded or interpreter_pool is None:
+        return False
+    try:
+        start_time = time.time()
+        if WARMUP_ITERATIONS > 0:
+            batch_sizes = warm_up_batch_sizes()
+            for variant, pool in ((FULL, interpreter_pool), (LIGHT, light_pool)):
+                if pool is None:
+                    continue
+                timings = pool.warm_up(batch_sizes, WARMUP_ITERATIONS)
+                for batch_size, (first, last) in sorted(timings.items()):
+                    record_warm_up(model_names[variant], batch_size, first, last)
+                logger.info(f"Warmed up {model_names[variant]}: " + ", ".join(
+                    f"batch {batch_size} {first * 1000:.1f}ms first / {last * 1000:.1f}ms steady"
+                    for batch_size, (first, last) in sorted(timings.items())))
+        record_startup_phase('warm_up', time.time() - start_time)
+        logger.info(f"Model warmed up in {time.time() - start_time:.3f}s, startup phases: "
+                    + ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in startup_phases().items()))
+        model_warm = True
+        return True
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {e}")
+        return False
+
+def reinit_after_fork():
+    """Restore per-process model state in a worker forked from a preloaded master
+
+    Threads do not survive fork(): the micro-batcher, the decode pool and the
+    system stats sampler are started again, and the interpreters are rebuilt (and
+    warmed up again) when they run on TFLite's own thread pool (more than one
+    TFLite thread). Single-threaded interpreters are kept, so their weights
+    stay shared copy-on-write with the master; their gauges are published
+    again, as each process reports its own in multiprocess metrics mode.
+    """
+    global batcher, light_batcher, decode_executor
+    decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS or available_cpu_count(),
+                                         thread_name_prefix='decode')
+    system_sampler.start()
+    if not model_loaded:
+        return False
+    if THREAD_CONFIG.get('tflite_threads', 1) > 1:
+        return load_model() and warm_up_model()
+    interpreter_pool.publish_metrics()
+    if model_selector is not None:
+        model_selector.publish_metrics()
+    batcher = create_batcher(interpreter_pool)
+    if light_pool is not None:
+        light_batcher = create_batcher(light_pool)
+    return True
+
+def process_memory():
+    """Memory of this process: rss, plus uss/pss (private and proportional) where available"""
+    process = psutil.Process()
+    try:
+        info = process.memory_full_info()
+    except (psutil.AccessDenied, OSError):
+        info = process.memory_info()
+    memory = {name: getattr(info, name) for name in ('rss', 'uss', 'pss', 'shared') if hasattr(info, name)}
+    for name, value in memory.items():
+        PROCESS_MEMORY.labels(type=name).set(value)
+    return memory
+
+def sample_process():
+    """Per-process stats refreshed by the background sampler"""
+    return {
+        'memory': process_memory(),
+        'interpreter_busy_ratio': interpreter_pool.sample_busy_ratio() if interpreter_pool is not None else None
+    }
+
+# Health endpoints read cached samples instead of calling psutil per probe
+# (started by start_worker_threads)
+system_sampler = SystemSampler(HEALTH_SAMPLE_INTERVAL, sample_process)
+
+def liveness():
+    """Liveness probe result (status, body): the process is up and answering"""
+    return 200, {'status': 'alive', 'pid': os.getpid()}
+
+def readiness():
+    """Readiness probe result (status, body)
+    
+    Ready once the model is loaded and warmed up, and while admission control
+    would still accept a new request, so a saturated pod is taken out of the
+    load balancer instead of shedding or queueing more traffic.
+    """
+    checks = {
+        'model_loaded': model_loaded,
+        'warmed_up': model_warm,
+        'admission': admission is None or not admission.saturated()
+    }
+    ready = all(checks.values())
+    READY.set(1 if ready else 0)
+    return (200 if ready else 503), {'status': 'ready' if ready else 'not_ready', 'checks': checks}
+
+def start_worker_threads():
+    """Start the system stats sampler and serve /live and /ready on PROBE_PORT
+    
+    Called by every entry point once the process serves requests, i.e. in
+    each gunicorn worker rather than in the preloading master, so that no
+    worker inherits locks held by a thread at fork time.
+    """
+    system_sampler.start()
+    if not PROBE_PORT:
+        return None
+    return start_probe_server(PROBE_PORT, {'/live': liveness, '/ready': readiness})
+
+def decode_base64_payload(base64_string):
+    """Decode base64 payload into raw image file bytes"""
     try:
         # Remove possible data URL prefix
         if ',' in base64_string:
             base64_string = base64_string.split(',')[1]
         
         # Decode base64
-        image_data = base64.b64decode(base64_string)
-        
+        return base64.b64decode(base64_string)
+    except Exception as e:
+        logger.error(f"Failed to decode base64 payload: {e}")
+        return None
+
+def decode_image_bytes(image_data, min_size=None, max_dimension=None):
+    """Decode raw image file bytes into an RGB numpy array
+    
+    When min_size is given, JPEGs are decoded with DCT-domain scaling straight
+    to the smallest scale whose sides are at least min_size pixels, instead of
+    materialising the full-resolution image. max_dimension does the same for
+    images that are only needed at that size on their longest side. Returns
+    (image_array, original_shape) where original_shape is the (height, width)
+    of the encoded image, used to scale boxes back to the original resolution.
+    """
+    try:
         # Convert to PIL image
         image = Image.open(io.BytesIO(image_data))
+        original_shape = (image.height, image.width)
+        
+        # Reduced-scale JPEG decode (no-op for other formats)
+        if min_size or max_dimension:
+            requested_width = requested_height = min_size or 0
+            if max_dimension:
+                ratio = min(1.0, max_dimension / max(image.width, image.height))
+                requested_width = max(requested_width, math.ceil(image.width * ratio))
+                requested_height = max(requested_height, math.ceil(image.height * ratio))
+            image.draft('RGB', (requested_width, requested_height))
         
         # Convert to RGB format
         if image.mode != 'RGB':
@@ -92,150 +500,427 @@ def decode_base64_image(base64_string):
         # Convert to numpy array
         image_array = np.array(image)
         
-        return image_array
+        return image_array, original_shape
     except Exception as e:
-        logger.error(f"Failed to decode base64 image: {e}")
+        logger.error(f"Failed to decode image: {e}")
+        return None, None
+
+def decode_base64_image(base64_string):
+    """Decode base64 image data"""
+    image_data = decode_base64_payload(base64_string)
+    if image_data is None:
         return None
+    return decode_image_bytes(image_data)[0]
 
-def encode_image_to_base64(image_array):
-    """Encode image array to base64 string"""
+def encode_image(image_array, image_format='jpeg', quality=95, in_place=False):
+    """Encode RGB image array to JPEG, WebP or PNG bytes
+    
+    Uses OpenCV's encoders (libjpeg-turbo/libwebp). With in_place the array's
+    channels are swapped to BGR in place instead of on a copy, for callers
+    that no longer need the image.
+    """
     try:
-        # Convert to PIL image
-        image = Image.fromarray(image_array.astype(np.uint8))
+        image_array = image_array.astype(np.uint8, copy=False)
+        if in_place:
+            bgr_image = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR, dst=image_array)
+        else:
+            bgr_image = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
         
-        # Save to byte stream
-        buffer = io.BytesIO()
-        image.save(buffer, format='JPEG', quality=95)
+        if image_format == 'png':
+            params = [cv2.IMWRITE_PNG_COMPRESSION, ANNOTATED_IMAGE_PNG_COMPRESSION]
+        elif image_format == 'webp':
+            params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        else:
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
         
-        # Encode to base64
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        success, buffer = cv2.imencode(IMAGE_FORMATS[image_format][0], bgr_image, params)
+        if not success:
+            raise ValueError(f"OpenCV could not encode {image_format}")
         
-        return image_base64
+        return buffer.tobytes()
     except Exception as e:
-        logger.error(f"Failed to encode image to base64: {e}")
+        logger.error(f"Failed to encode image: {e}")
         return None
 
-def detect_persons(image_array):
-    """Detect persons in image and return bounding boxes"""
+def encode_image_to_base64(image_array, image_format='jpeg', quality=95, in_place=False):
+    """Encode image array to base64 string"""
+    image_bytes = encode_image(image_array, image_format, quality, in_place)
+    if image_bytes is None:
+        return None
+    
+    # Encode to base64
+    return base64.b64encode(image_bytes).decode('utf-8')
+
+def resize_to_max_dimension(image_array, max_dimension):
+    """Downscale image so its longest side is at most max_dimension"""
+    height, width = image_array.shape[:2]
+    if not max_dimension or max(height, width) <= max_dimension:
+        return image_array
+    ratio = max_dimension / max(height, width)
+    size = (max(1, int(round(width * ratio))), max(1, int(round(height * ratio))))
+    return cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
+
+def detect_persons(image_array, original_shape=None, variant=FULL, deadline=None):
+    """Detect persons in image and return bounding boxes
+    
+    original_shape is the (height, width) boxes are reported in, for images
+    that were decoded at reduced resolution. variant selects the full or the
+    light model.
+    """
     # Simple person detection implementation (based on keypoint visibility)
     # In real applications, specialized person detection models can be used
-    height, width = image_array.shape[:2]
+    height, width = original_shape or image_array.shape[:2]
     
     # Perform pose detection to get keypoints
-    keypoints = predict_pose_single(image_array)
+    keypoints = predict_pose_single(image_array, variant, deadline)
     
-    persons = []
-    if keypoints and len(keypoints) > 0:
-        # keypoints is a 17x3 list, each element is [y, x, confidence]
-        # Calculate bounding box
-        visible_points = []
-        confidence_scores = []
+    # Compute the box from the visible keypoints
+    return persons_from_keypoints(keypoints, [(height, width)])[0]
+
+def preprocess_image(image_array, input_shape):
+    """Resize an image to the model input (height, width) and normalize it to [0,1] float32"""
+    resized_image = cv2.resize(image_array, (int(input_shape[1]), int(input_shape[0])))
+    return resized_image.astype(np.float32) / 255.0
+
+def predict_pose_single(image_array, variant=FULL, deadline=None):
+    """Perform single-person pose detection using MoveNet model
+    
+    With a deadline, the request is dropped (RequestAbandoned) instead of
+    taking an interpreter once it expired or its client went away.
+    """
+    if not model_loaded or interpreter_pool is None:
+        raise Exception("Model not loaded")
+    
+    deadline = deadline or Deadline()
+    try:
+        pool, variant_batcher = model_variant(variant)
+        
+        # Resize image and normalize to [0,1] before taking an interpreter
+        input_data = preprocess_image(image_array, pool.input_details[0]['shape'][1:3])
         
-        for i, kp in enumerate(keypoints):
+        deadline.check('queue')
+        inference_start = time.time()
+        timeout = deadline.timeout(INTERPRETER_CHECKOUT_TIMEOUT)
+        if variant_batcher is not None:
+            # Let the scheduler run this image together with concurrent requests
             try:
-                # Ensure kp is a list with 3 elements
-                if isinstance(kp, list) and len(kp) >= 3:
-                    confidence = float(kp[2]) if not isinstance(kp[2], list) else float(kp[2][0]) if kp[2] else 0.0
-                    if confidence > 0.3:  # Check confidence
-                        x_coord = float(kp[1]) if not isinstance(kp[1], list) else float(kp[1][0]) if kp[1] else 0.0
-                        y_coord = float(kp[0]) if not isinstance(kp[0], list) else float(kp[0][0]) if kp[0] else 0.0
-                        x = x_coord * width  # x coordinate
-                        y = y_coord * height  # y coordinate
-                        visible_points.append((x, y))
-                        confidence_scores.append(confidence)
-            except (TypeError, ValueError, IndexError) as e:
-                logger.warning(f"Skipping keypoint {i} due to format error: {e}, kp: {kp}")
-                continue
+                keypoints, waited = variant_batcher.infer(input_data, timeout=timeout, deadline=deadline)
+            except FuturesTimeout:
+                deadline.check('inference')
+                raise
+            record_pool_wait(waited)
+        else:
+            # Check out an interpreter for the inference itself
+            try:
+                with pool.checkout(timeout=timeout) as interpreter:
+                    record_pool_wait(time.time() - inference_start)
+                    # The wait may have outlived the deadline
+                    deadline.check('inference')
+                    keypoints_output = pool.run(interpreter, np.expand_dims(input_data, axis=0))
+            except PoolTimeout:
+                deadline.check('queue')
+                raise
+            keypoints = keypoints_output.reshape(-1, 3)  # Shape: (17, 3) - [y, x, confidence]
+        record_inference(variant, time.time() - inference_start, waited=admission_wait())
         
-        if visible_points:
-            x_coords = [p[0] for p in visible_points]
-            y_coords = [p[1] for p in visible_points]
-            
-            x_min, x_max = min(x_coords), max(x_coords)
-            y_min, y_max = min(y_coords), max(y_coords)
-            
-            # Add margin
-            margin = 20
-            x_min = max(0, x_min - margin)
-            y_min = max(0, y_min - margin)
-            x_max = min(width, x_max + margin)
-            y_max = min(height, y_max + margin)
-            
-            box = {
-                "x": int(x_min),
-                "y": int(y_min),
-                "width": int(x_max - x_min),
-                "height": int(y_max - y_min),
-                "probability": float(np.mean(confidence_scores)) if confidence_scores else 0.0
+        return keypoints
+        
+    except RequestAbandoned:
+        raise
+    except Exception as e:
+        logger.error(f"Pose prediction failed: {e}")
+        raise
+
+def detect_persons_multi(image_array, original_shape=None, max_crops=None, variant=FULL, deadline=None):
+    """Detect several persons by running a cascade of crops in one batch
+    
+    The whole frame and square tiles at increasing zoom are resized into one
+    input tensor and inferred with a single batched invoke; the per-crop
+    detections are mapped back to the frame and deduplicated. Returns the
+    persons and per-crop details (window in original image coordinates,
+    index of the person it produced, preprocess and inference time).
+    """
+    height, width = original_shape or image_array.shape[:2]
+    image_height, image_width = image_array.shape[:2]
+    pool, _ = model_variant(variant)
+    input_height, input_width = (int(v) for v in pool.input_details[0]['shape'][1:3])
+    max_crops = min(max_crops or MULTI_PERSON_MAX_CROPS, MULTI_PERSON_MAX_CROPS)
+    
+    # Cut and resize every crop into its slot of the batch tensor
+    crops = plan_crops(image_height, image_width, max_crops)
+    resized_batch = np.empty((len(crops), input_height, input_width, 3), dtype=np.uint8)
+    crop_times = []
+    for i, (x, y, crop_width, crop_height) in enumerate(crops):
+        crop_start = time.time()
+        cv2.resize(image_array[y:y + crop_height, x:x + crop_width], (input_width, input_height),
+                   dst=resized_batch[i])
+        crop_times.append(time.time() - crop_start)
+    input_data = np.empty(resized_batch.shape, dtype=np.float32)
+    np.multiply(resized_batch, np.float32(1.0 / 255.0), out=input_data)
+    
+    # All crops in one batched invoke
+    keypoints, inference_times = run_batch_inference(input_data, chunk_size=len(crops), variant=variant,
+                                                     deadline=deadline)
+    persons, crop_person = merge_crop_detections(keypoints, crops, (image_height, image_width), (height, width))
+    
+    scale_x, scale_y = width / image_width, height / image_height
+    crop_details = []
+    for i, (x, y, crop_width, crop_height) in enumerate(crops):
+        crop_details.append({
+            'x': int(x * scale_x),
+            'y': int(y * scale_y),
+            'width': int(crop_width * scale_x),
+            'height': int(crop_height * scale_y),
+            'person': crop_person[i],
+            'speed_preprocess': round(crop_times[i], 6),
+            'speed_inference': round(inference_times[i], 6)
+        })
+    return persons, crop_details
+
+def process_image_payload(image_data, keep_image=False, reduced_decode=None, multi_person=False, max_crops=None,
+                          max_dimension=None, variant=FULL, deadline=None):
+    """Decode an image payload and detect the persons in it
+    
+    image_data is either a base64 string (JSON requests) or the raw image file
+    bytes (binary uploads). For base64 payloads the result cache is consulted
+    first with a hash of the raw payload; both kinds are then looked up by a
+    hash of the image file bytes, so repeated frames skip decoding and
+    inference. Concurrent requests for the same image bytes share a single
+    detect_persons() call. Unless reduced_decode is False (or keep_image asks
+    for the full-resolution image), JPEGs are decoded at reduced scale. A
+    kept image that is only needed up to max_dimension pixels (thumbnails)
+    is decoded at the matching reduced scale. With multi_person, detection
+    runs the crop cascade of detect_persons_multi(). variant selects the full
+    or the light model; their results are cached separately, and a request
+    on the light model takes a cached full model result for the same image
+    first. The deadline is checked before decoding and carried into inference.
+    
+    Returns a dict with 'persons', 'image' (None when the image was never
+    decoded), 'original_shape', 'cache_hit', 'crops' (multi-person crop
+    details of a fresh inference, otherwise empty), 'model' (name of the
+    model variant that produced the persons) and the preprocess/inference timings, or None if the
+    payload is not a valid image. Admission (admit()) is only waited for on a
+    cache miss, and not by requests sharing another one's inference.
+    """
+    preprocess_start = time.time()
+    deadline = deadline or Deadline()
+    
+    # Results of different detection modes are cached separately
+    if multi_person:
+        max_crops = min(max_crops or MULTI_PERSON_MAX_CROPS, MULTI_PERSON_MAX_CROPS)
+        mode_suffix = f':multi{max_crops}'
+    else:
+        mode_suffix = ''
+    # Under load (light model) a full model result is still the better answer
+    lookup_suffixes = [mode_suffix, mode_suffix + ':light'] if variant == LIGHT else [mode_suffix]
+    if variant == LIGHT:
+        mode_suffix += ':light'
+    
+    def cached_variant(key):
+        return LIGHT if key.endswith(':light') else FULL
+    
+    payload_key = None
+    if result_cache is not None and not keep_image and isinstance(image_data, str):
+        payload_hash = 'payload:' + content_key(image_data.encode('utf-8', 'surrogatepass'))
+        payload_key = payload_hash + mode_suffix
+        hit_key, persons = result_cache.get_any([payload_hash + suffix for suffix in lookup_suffixes],
+                                                lookup='payload')
+        if persons is not None:
+            return {
+                'persons': persons,
+                'image': None,
+                'original_shape': None,
+                'cache_hit': True,
+                'crops': [],
+                'model': model_names[cached_variant(hit_key)],
+                'preprocess_time': time.time() - preprocess_start,
+                'inference_time': 0.0
             }
-            
-            persons.append({
-                "box": box,
-                "keypoints": keypoints
-            })
     
-    return persons
+    # Decode base64 (binary uploads already carry the image file bytes)
+    deadline.check('decode')
+    image_bytes = decode_base64_payload(image_data) if isinstance(image_data, str) else image_data
+    if image_bytes is None:
+        return None
+    
+    image_hash = 'image:' + content_key(image_bytes)
+    image_key = image_hash + mode_suffix
+    persons = None
+    if result_cache is not None:
+        hit_key, persons = result_cache.get_any([image_hash + suffix for suffix in lookup_suffixes],
+                                                lookup='content')
+        if persons is not None:
+            variant = cached_variant(hit_key)
+        if persons is not None and not keep_image:
+            return {
+                'persons': persons,
+                'image': None,
+                'original_shape': None,
+                'cache_hit': True,
+                'crops': [],
+                'model': model_names[variant],
+                'preprocess_time': time.time() - preprocess_start,
+                'inference_time': 0.0
+            }
+    if persons is None and not (inflight_inferences is not None and inflight_inferences.running(image_key)):
+        # Requests that will wait for another one's inference take no slot
+        admit()
+    
+    if reduced_decode is None:
+        reduced_decode = REDUCED_DECODE_ENABLED and (not keep_image or bool(max_dimension))
+    min_size = None
+    if reduced_decode and interpreter_pool is not None:
+        min_size = int(max(model_variant(variant)[0].input_details[0]['shape'][1:3]))
+        if multi_person:
+            # Keep the smallest tiles at or above the model input size
+            min_size = int(math.ceil(min_size / min(TILE_SCALES)))
+    
+    image_array, original_shape = decode_image_bytes(
+        image_bytes, min_size=min_size, max_dimension=max_dimension if reduced_decode and keep_image else None)
+    if image_array is None:
+        return None
+    IMAGE_MEGAPIXELS.observe(original_shape[0] * original_shape[1] / 1e6)
+    
+    preprocess_time = time.time() - preprocess_start
+    
+    # Inference stage
+    inference_start = time.time()
+    cache_hit = persons is not None
+    crops = []
+    if not cache_hit:
+        def run_detection():
+            # Runs only once per key: a request that expected to share another
+            # one's inference and became the one to run it is admitted now
+            admit()
+            # Detect persons
+            if multi_person:
+                detected, crop_details = detect_persons_multi(image_array, original_shape, max_crops, variant,
+                                                              deadline)
+            else:
+                detected, crop_details = detect_persons(image_array, original_shape, variant, deadline), []
+            if result_cache is not None:
+                result_cache.put(image_key, detected, aliases=[payload_key] if payload_key else ())
+            return detected, crop_details
+        
+        if inflight_inferences is not None:
+            # Identical images submitted concurrently share one inference
+            (persons, crops), _ = share_inference(image_key, run_detection, deadline)
+        else:
+            persons, crops = run_detection()
+    inference_time = time.time() - inference_start
+    
+    return {
+        'persons': persons,
+        'image': image_array,
+        'original_shape': original_shape,
+        'cache_hit': cache_hit,
+        'crops': crops,
+        'model': model_names[variant],
+        'preprocess_time': preprocess_time,
+        'inference_time': inference_time
+    }
 
-def predict_pose_single(image_array):
-    """Perform single-person pose detection using MoveNet model"""
-    global interpreter, model_lock
+def share_inference(key, run_detection, deadline):
+    """Run a detection once among concurrent requests for the same key
     
-    if not model_loaded or interpreter is None:
+    A request waiting for another one's inference gives up when its own
+    deadline passes, or after INTERPRETER_CHECKOUT_TIMEOUT without one, and
+    is answered with 504 instead of hanging on a stuck inference.
+    """
+    try:
+        try:
+            return inflight_inferences.do(key, run_detection, deadline.timeout(INTERPRETER_CHECKOUT_TIMEOUT))
+        except RequestAbandoned:
+            # Don't inherit another request's expired deadline or
+            # disconnect: retry unless this request was abandoned too
+            if deadline.abandoned():
+                raise
+            return inflight_inferences.do(key, run_detection, deadline.timeout(INTERPRETER_CHECKOUT_TIMEOUT))
+    except SingleFlightTimeout:
+        DEADLINE_EXCEEDED.labels(stage='inference').inc()
+        raise DeadlineExceeded('inference')
+
+def run_batch_inference(input_data, chunk_size=None, variant=FULL, deadline=None):
+    """Run a (B, H, W, 3) input tensor through the interpreter pool
+    
+    The tensor is split into chunks of at most chunk_size (default
+    BATCH_MAX_SIZE) images, padded to a supported batch size, which run
+    concurrently on the interpreters of the variant's pool. Chunks are
+    dropped before taking an interpreter once the deadline has passed.
+    Returns the (B, 17, 3) keypoints and the inference time of each image,
+    i.e. its chunk's invoke time divided by the chunk size. The longest wait
+    of a chunk for its interpreter is recorded as the request's pool wait.
+    """
+    if not model_loaded or interpreter_pool is None:
         raise Exception("Model not loaded")
     
-    # Use thread lock to protect the entire inference process
-    with model_lock:
+    pool, _ = model_variant(variant)
+    deadline = deadline or Deadline()
+    chunk_size = chunk_size or BATCH_MAX_SIZE
+    waited = admission_wait()
+    batch_sizes = supported_batch_sizes(chunk_size)
+    
+    def run_chunk(start):
+        chunk = input_data[start:start + chunk_size]
+        count = len(chunk)
+        padded_size = next(size for size in batch_sizes if size >= count)
+        if padded_size != count:
+            chunk = np.concatenate([chunk, np.zeros((padded_size - count, *chunk.shape[1:]), dtype=chunk.dtype)])
+        
+        deadline.check('queue')
+        chunk_start = time.time()
         try:
-            # Get input and output details
-            input_details = interpreter.get_input_details()
-            output_details = interpreter.get_output_details()
-            
-            # Get input size
-            input_shape = input_details[0]['shape'][1:3]  # [height, width]
-            
-            # Resize image
-            resized_image = cv2.resize(image_array, (input_shape[1], input_shape[0]))
-            
-            # Normalize to [0,1]
-            input_data = np.expand_dims(resized_image, axis=0).astype(np.float32) / 255.0
-            
-            # Execute inference
-            interpreter.set_tensor(input_details[0]['index'], input_data)
-            interpreter.invoke()
-            
-            # Get keypoint output and immediately copy data to avoid memory reference issues
-            keypoints_output = interpreter.get_tensor(output_details[0]['index']).copy()
-            keypoints = keypoints_output[0]  # Shape: (17, 3) - [y, x, confidence]
-            
-            # Convert to list format
-            keypoints_list = keypoints.tolist()
-            
-            return keypoints_list
-            
-        except Exception as e:
-            logger.error(f"Pose prediction failed: {e}")
+            with pool.checkout(timeout=deadline.timeout(INTERPRETER_CHECKOUT_TIMEOUT)) as interpreter:
+                pool_wait = time.time() - chunk_start
+                deadline.check('inference')
+                output = pool.run(interpreter, chunk)
+        except PoolTimeout:
+            deadline.check('queue')
             raise
+        chunk_time = time.time() - chunk_start
+        record_inference(variant, chunk_time, count, waited)
+        return output.reshape(padded_size, -1, 3)[:count], [chunk_time / count] * count, pool_wait
+    
+    starts = range(0, len(input_data), chunk_size)
+    if len(starts) == 1:
+        chunks = [run_chunk(0)]
+    else:
+        chunks = list(decode_executor.map(run_chunk, starts))
+    # Chunks wait for interpreters concurrently
+    record_pool_wait(max(chunk[2] for chunk in chunks))
+    
+    keypoints = np.concatenate([chunk[0] for chunk in chunks])
+    item_times = [t for chunk in chunks for t in chunk[1]]
+    return keypoints, item_times
 
-def draw_pose_on_image(image_array, persons):
-    """Draw pose keypoints and skeleton connections on image"""
+def draw_pose_on_image(image_array, persons, original_shape=None, in_place=False):
+    """Draw pose keypoints and skeleton connections on image
+    
+    original_shape is the (height, width) the person boxes refer to, when the
+    image was decoded or resized to a different size. With in_place the
+    image is drawn on directly instead of on a copy.
+    """
     try:
-        # Copy image to avoid modifying original
-        annotated_image = image_array.copy()
+        # Copy image to avoid modifying original (unless the caller is done with it)
+        annotated_image = image_array if in_place else image_array.copy()
         height, width = annotated_image.shape[:2]
         
+        # Boxes are in original image coordinates
+        box_height, box_width = original_shape or (height, width)
+        scale_x, scale_y = width / box_width, height / box_height
+        
         for person in persons:
             keypoints = person['keypoints']
             box = person['box']
+            x1, y1 = int(box['x'] * scale_x), int(box['y'] * scale_y)
+            x2, y2 = int((box['x'] + box['width']) * scale_x), int((box['y'] + box['height']) * scale_y)
             
             # Draw bounding box
-            cv2.rectangle(annotated_image, 
-                         (box['x'], box['y']), 
-                         (box['x'] + box['width'], box['y'] + box['height']), 
-                         BOX_COLOR, 2)
+            cv2.rectangle(annotated_image, (x1, y1), (x2, y2), BOX_COLOR, 2)
             
             # Draw confidence
             cv2.putText(annotated_image, f"{box['probability']:.2f}", 
-                       (box['x'], box['y'] - 10), 
+                       (x1, y1 - 10), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, BOX_COLOR, 1)
             
             # Draw skeleton connections
@@ -266,25 +951,366 @@ def draw_pose_on_image(image_array, persons):
         logger.error(f"Failed to draw pose on image: {e}")
         return image_array
 
+def error_response(message, status, error_type, request_id=None):
+    """Count an error and build its JSON response"""
+    ERROR_COUNT.labels(error_type=error_type).inc()
+    response = {
+        'status': 'error',
+        'message': message
+    }
+    if request_id is not None:
+        response['id'] = request_id
+    return jsonify(response), status
+
+def record_stage_times(**stages):
+    """Add to the time the current request spent in each processing stage
+    
+    Stages are parse (reading the request body), queue (admission wait),
+    decode (base64 and image decoding, the speed_preprocess of the response),
+    pool (waiting for an interpreter or a batch), inference, render
+    (formatting results, drawing and encoding the annotated image:
+    speed_postprocess) and serialize (JSON encoding of the response).
+    """
+    stage_times = g.setdefault('stage_times', {})
+    for stage, seconds in stages.items():
+        stage_times[stage] = stage_times.get(stage, 0.0) + seconds
+
+def record_pool_wait(seconds):
+    """Add to the time the current request waited for an interpreter or its batch"""
+    if has_request_context():
+        g.pool_wait = g.get('pool_wait', 0.0) + seconds
+
+def inference_stages(inference_time):
+    """Split the inference time of a request into its pool wait and the inference itself"""
+    pool_wait = min(g.pop('pool_wait', 0.0), inference_time)
+    return {'pool': pool_wait, 'inference': inference_time - pool_wait}
+
+def json_response(payload, status=200, headers=None):
+    """jsonify a response body, timing it as the serialize stage"""
+    serialize_start = time.time()
+    response = jsonify(payload)
+    record_stage_times(serialize=time.time() - serialize_start)
+    return response, status, headers or {}
+
+def server_timing(stage_times, total):
+    """Server-Timing header value for the stage times and total, in milliseconds"""
+    metrics = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in stage_times.items()]
+    metrics.append(f"total;dur={total * 1000:.3f}")
+    return ', '.join(metrics)
+
+def request_endpoint():
+    """Route the current request matched, used as the endpoint label of metrics"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.time()
+    if request.content_length:
+        PAYLOAD_SIZE.labels(endpoint=request_endpoint()).observe(request.content_length)
+
+@app.before_request
+def begin_request_profile():
+    """Profile pose requests while a profiling session is running"""
+    session = profiling_session
+    if session is not None and request.path.startswith('/api/'):
+        g.profile = (session, session.begin_request())
+
+@app.teardown_request
+def end_request_profile(error=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        session, token = profile
+        session.end_request(token)
+
+@app.after_request
+def record_request_metrics(response):
+    """Observe the duration of the request and of each of its processing stages
+    
+    The stage times are also returned in a Server-Timing header, so clients
+    can separate network time from server-side queueing and compute.
+    """
+    endpoint = request_endpoint()
+    total = time.time() - g.request_start
+    stage_times = g.get('stage_times', {})
+    REQUEST_DURATION.labels(endpoint=endpoint).observe(total)
+    for stage, seconds in stage_times.items():
+        STAGE_DURATION.labels(endpoint=endpoint, stage=stage).observe(seconds)
+    if stage_times:
+        response.headers['Server-Timing'] = server_timing(stage_times, total)
+    return response
+
+def client_disconnect_check():
+    """Callable reporting whether the current request's client has gone away, if detectable"""
+    if not DISCONNECT_DETECTION_ENABLED:
+        return None
+    event = request.environ.get('cloudpose.disconnected')  # set by asgi.py
+    if event is not None:
+        return event.is_set
+    sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+    if sock is not None:
+        return functools.partial(socket_disconnected, sock)
+    return None
+
+def parse_request_deadline():
+    """Read the request deadline, returns (deadline, error_response)
+    
+    Clients send either an absolute deadline (Unix time in seconds) in the
+    X-Request-Deadline header or a "deadline" field, or a relative budget in
+    seconds in X-Request-Timeout or a "timeout" field. REQUEST_TIMEOUT_SECONDS
+    caps both.
+    """
+    now = time.time()
+    expires_at = None
+    try:
+        deadline_value = request.headers.get('X-Request-Deadline') or request_option('deadline')
+        timeout_value = request.headers.get('X-Request-Timeout') or request_option('timeout')
+        if deadline_value is not None:
+            expires_at = float(deadline_value)
+        elif timeout_value is not None:
+            expires_at = now + float(timeout_value)
+    except (TypeError, ValueError):
+        return None, error_response('Deadline and timeout must be numbers of seconds', 400, 'invalid_deadline',
+                                    header_request_id())
+    if REQUEST_TIMEOUT_SECONDS:
+        expires_at = min(expires_at or math.inf, now + REQUEST_TIMEOUT_SECONDS)
+    return Deadline(expires_at, client_disconnect_check()), None
+
+def current_deadline():
+    """Deadline of the current request (set up by with_deadline)"""
+    return g.get('deadline') or Deadline()
+
+def abandoned_response(error, request_id=None):
+    """Response for a request dropped because its deadline passed (504) or its client left (499)"""
+    if isinstance(error, DeadlineExceeded):
+        return error_response(str(error), 504, 'deadline_exceeded', request_id)
+    return error_response(str(error), 499, 'client_disconnected', request_id)
+
+def with_deadline(endpoint):
+    """Parse the request deadline before the endpoint (and its admission wait) runs"""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        # Deadline fields may be in the body, which is parsed (and cached) here
+        parse_start = time.time()
+        deadline, error = parse_request_deadline()
+        record_stage_times(parse=time.time() - parse_start)
+        if error is not None:
+            return error
+        g.deadline = deadline
+        return endpoint(*args, **kwargs)
+    return wrapper
+
+def admit(weight=1):
+    """Wait for admission before the current request runs inference on weight images
+    
+    Called once a request is known to miss the result cache, so cache hits are
+    neither queued nor shed. Raises AdmissionRejected or RequestAbandoned; the
+    slots are held until the endpoint returns (see admission_controlled).
+    """
+    if admission is None or not has_request_context() or 'admission' in g:
+        return
+    deadline = current_deadline()
+    arrived = time.time()
+    deadline.check('admission')
+    try:
+        ticket = admission.acquire(timeout=deadline.remaining(), weight=weight)
+    except AdmissionRejected:
+        # The wait for a slot may have used up the deadline
+        deadline.check('admission')
+        raise
+    g.admission = (ticket, weight)
+    g.admission_wait = ticket - arrived
+    record_stage_times(queue=ticket - arrived)
+
+def admission_wait():
+    """Seconds the current request waited for admission (0 outside a request)"""
+    return g.get('admission_wait', 0.0) if has_request_context() else 0.0
+
+def overloaded_response(error, request_id=None):
+    """429 response with Retry-After for a request shed by admission control"""
+    response, status = error_response(f'Server overloaded, retry after {error.retry_after}s', 429,
+                                      'overloaded', request_id)
+    return response, status, {'Retry-After': str(error.retry_after)}
+
+def admission_controlled(endpoint):
+    """Release the admission slots an endpoint took with admit() when it returns"""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            admitted = g.pop('admission', None)
+            if admitted is not None:
+                admission.release(*admitted)
+    return wrapper
+
+def header_request_id():
+    """Request id supplied outside the body (binary and multipart uploads)"""
+    return request.headers.get('X-Request-ID') or request.args.get('id')
+
+def parse_pose_request():
+    """Extract (request_id, image_data, error) from a pose request
+    
+    Accepts JSON with a base64 "image" string, a raw image body
+    (application/octet-stream or image/*) or a multipart form with an "image"
+    file or base64 field. For binary and multipart uploads the id may come from
+    the X-Request-ID header, the "id" query parameter or an "id" form field.
+    image_data is a base64 string for JSON/form fields and raw bytes otherwise;
+    error is a ready-made error response or None.
+    """
+    content_type = request.mimetype
+    
+    if request.is_json:
+        # Get request data
+        data = request.get_json()
+        
+        # Validate required parameters
+        if not data or 'image' not in data or 'id' not in data:
+            return None, None, error_response('Required parameters "image" and "id" are missing',
+                                              400, 'missing_parameters')
+        
+        image_data = data['image']
+        request_id = data['id']
+        
+        # Validate parameter types
+        if not isinstance(image_data, str) or not isinstance(request_id, str):
+            return None, None, error_response('Parameters "image" and "id" must be strings',
+                                              400, 'invalid_parameter_type')
+        
+        return request_id, image_data, None
+    
+    if content_type == 'application/octet-stream' or content_type.startswith('image/'):
+        image_data = request.get_data(cache=False)
+        request_id = header_request_id()
+    elif content_type == 'multipart/form-data':
+        upload = request.files.get('image')
+        image_data = upload.read() if upload is not None else request.form.get('image')
+        request_id = request.form.get('id') or header_request_id()
+    else:
+        return None, None, error_response(
+            'Content-Type must be application/json, application/octet-stream, image/* or multipart/form-data',
+            400, 'invalid_content_type')
+    
+    if not image_data or not request_id:
+        return None, None, error_response(
+            'Required parameters "image" and "id" are missing (send the id in the X-Request-ID header '
+            'or the "id" query parameter)', 400, 'missing_parameters')
+    
+    return request_id, image_data, None
+
+def request_option(name, default=None):
+    """Optional request parameter from the JSON body, form fields or query string"""
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and name in data:
+        return data[name]
+    if name in request.form:
+        return request.form[name]
+    return request.args.get(name, default)
+
+def flag_option(name, default=False):
+    """Boolean request parameter (JSON true/false or "1"/"true"/"yes" strings)"""
+    value = request_option(name)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def multi_person_options():
+    """Parse the multi_person flag and max_crops cap; returns (enabled, max_crops, error)"""
+    multi_person = flag_option('multi_person', MULTI_PERSON_DEFAULT)
+    max_crops = request_option('max_crops')
+    if max_crops is not None:
+        try:
+            max_crops = int(max_crops)
+            if max_crops < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return False, None, error_response('Parameter "max_crops" must be a positive integer',
+                                               400, 'invalid_parameter_type')
+    return multi_person, max_crops, None
+
+def accepted_image_format():
+    """Image format named by an Accept header that lists only image types, else None
+    
+    Headers that also accept JSON or anything (*/*), as browsers and most HTTP
+    clients send, keep the JSON response and the server's default format.
+    """
+    accepted = [mimetype for mimetype, quality in request.accept_mimetypes if quality > 0]
+    if not accepted or not all(mimetype.startswith('image/') for mimetype in accepted):
+        return None
+    best = request.accept_mimetypes.best_match([mimetype for _, mimetype in IMAGE_FORMATS.values()])
+    return next((name for name, (_, mimetype) in IMAGE_FORMATS.items() if mimetype == best), None)
+
+def output_image_options():
+    """Parse format, quality and max_dimension; returns (format, quality, max_dimension, error)"""
+    image_format = request_option('format')
+    if image_format is None:
+        # Fall back to an image-only Accept header, then the server default
+        image_format = accepted_image_format() or ANNOTATED_IMAGE_FORMAT
+    image_format = str(image_format).lower()
+    if image_format == 'jpg':
+        image_format = 'jpeg'
+    if image_format not in IMAGE_FORMATS:
+        return None, None, None, error_response(
+            f'Parameter "format" must be one of: {", ".join(IMAGE_FORMATS)}', 400, 'invalid_parameter_type')
+    
+    try:
+        quality = int(request_option('quality', ANNOTATED_IMAGE_QUALITY))
+        max_dimension = int(request_option('max_dimension', ANNOTATED_IMAGE_MAX_DIMENSION))
+        if not 1 <= quality <= 100 or max_dimension < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return None, None, None, error_response(
+            'Parameter "quality" must be an integer between 1 and 100 and "max_dimension" a positive integer',
+            400, 'invalid_parameter_type')
+    
+    return image_format, quality, max_dimension or None, None
+
+def wants_binary_image():
+    """Whether the client asked for a raw image instead of JSON"""
+    if request.args.get('response') == 'image':
+        return True
+    return accepted_image_format() is not None
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     REQUEST_COUNT.labels(method='GET', endpoint='/health').inc()
     
     try:
-        # Get system resource information
-        cpu_percent = psutil.cpu_percent()
-        memory = psutil.virtual_memory()
+        # System resource information, as last sampled in the background
+        stats = system_sampler.snapshot()
+        _, ready = readiness()
         
         return jsonify({
             'status': 'healthy' if model_loaded else 'unhealthy',
             'model_loaded': model_loaded,
+            'ready': ready['status'] == 'ready',
             'timestamp': datetime.now().isoformat(),
             'system': {
-                'cpu_percent': cpu_percent,
-                'memory_percent': memory.percent,
-                'memory_available': memory.available
-            }
+                'cpu_percent': stats.get('cpu_percent'),
+                'memory_percent': stats.get('memory_percent'),
+                'memory_available': stats.get('memory_available'),
+                'sampled_age': stats.get('age')
+            },
+            'interpreter_pool': {
+                'size': interpreter_pool.size if interpreter_pool else 0,
+                'in_use': interpreter_pool.in_use if interpreter_pool else 0
+            },
+            'runtime': dict(runtime.info(),
+                            model_load_rss_bytes=model_load_stats['rss_bytes'] if model_load_stats else None,
+                            startup=startup_phases())
+                       if runtime else None,
+            'threads': THREAD_CONFIG,
+            'models': {
+                'active': model_names[model_selector.current if model_selector else FULL],
+                'full': model_names[FULL],
+                'light': model_names[LIGHT] if light_pool else None,
+                'queue_depth': inference_queue_depth(),
+                'recent_p95': model_selector.p95() if model_selector else None
+            },
+            'admission': admission.status() if admission else None,
+            'process': dict(stats.get('process') or {}, pid=os.getpid())
         }), 200
     except Exception as e:
         ERROR_COUNT.labels(error_type='health_check').inc()
@@ -296,46 +1322,36 @@ def health_check():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/live', methods=['GET'])
+def live():
+    """Liveness probe (also served on PROBE_PORT)"""
+    status, body = liveness()
+    return jsonify(body), status
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe (also served on PROBE_PORT)"""
+    status, body = readiness()
+    return jsonify(body), status
+
 @app.route('/api/pose_detection', methods=['POST'])
+@with_deadline
+@admission_controlled
 def pose_detection():
     """Pose detection API endpoint - returns JSON data"""
     REQUEST_COUNT.labels(method='POST', endpoint='/api/pose_detection').inc()
     
-    start_time = time.time()
     preprocess_time = 0
     inference_time = 0
     postprocess_time = 0
     
     try:
-        # Validate request content type
-        if not request.is_json:
-            ERROR_COUNT.labels(error_type='invalid_content_type').inc()
-            return jsonify({
-                'status': 'error',
-                'message': 'Content-Type must be application/json'
-            }), 400
-        
-        # Get request data
-        data = request.get_json()
-        
-        # Validate required parameters
-        if not data or 'image' not in data or 'id' not in data:
-            ERROR_COUNT.labels(error_type='missing_parameters').inc()
-            return jsonify({
-                'status': 'error',
-                'message': 'Required parameters "image" and "id" are missing'
-            }), 400
-        
-        image_data = data['image']
-        request_id = data['id']
-        
-        # Validate parameter types
-        if not isinstance(image_data, str) or not isinstance(request_id, str):
-            ERROR_COUNT.labels(error_type='invalid_parameter_type').inc()
-            return jsonify({
-                'status': 'error',
-                'message': 'Parameters "image" and "id" must be strings'
-            }), 400
+        # Parse JSON, binary or multipart request
+        parse_start = time.time()
+        request_id, image_data, error = parse_pose_request()
+        record_stage_times(parse=time.time() - parse_start)
+        if error is not None:
+            return error
         
         # Check if model is loaded
         if not model_loaded:
@@ -346,12 +1362,14 @@ def pose_detection():
                 'message': 'Model not loaded'
             }), 503
         
-        # Preprocessing stage
-        preprocess_start = time.time()
+        multi_person, max_crops, error = multi_person_options()
+        if error is not None:
+            return error
         
-        # Decode image
-        image_array = decode_base64_image(image_data)
-        if image_array is None:
+        # Preprocessing and inference stages (on the light model while overloaded)
+        result = process_image_payload(image_data, multi_person=multi_person, max_crops=max_crops,
+                                       variant=select_model(), deadline=current_deadline())
+        if result is None:
             ERROR_COUNT.labels(error_type='invalid_image').inc()
             return jsonify({
                 'status': 'error',
@@ -359,22 +1377,15 @@ def pose_detection():
                 'message': 'Invalid image format or corrupted data'
             }), 400
         
-        preprocess_time = time.time() - preprocess_start
-        
-        # Inference stage
-        inference_start = time.time()
-        
-        # Detect persons
-        persons = detect_persons(image_array)
-        
-        inference_time = time.time() - inference_start
+        persons = result['persons']
+        preprocess_time = result['preprocess_time']
+        inference_time = result['inference_time']
         
         # Postprocessing stage
         postprocess_start = time.time()
         
         # Format response data
-        boxes = [person['box'] for person in persons]
-        keypoints = [person['keypoints'] for person in persons]
+        boxes, keypoints = serialize_persons(persons)
         count = len(persons)
         
         postprocess_time = time.time() - postprocess_start
@@ -382,20 +1393,31 @@ def pose_detection():
         # Record successful pose detection
         POSE_DETECTION_COUNT.inc()
         
-        # Record request duration
-        REQUEST_DURATION.observe(time.time() - start_time)
+        record_stage_times(decode=preprocess_time, **inference_stages(inference_time), render=postprocess_time)
         
-        # Return success response
-        return jsonify({
+        response = {
             'id': request_id,
             'count': count,
             'boxes': boxes,
             'keypoints': keypoints,
+            'model': result['model'],
             'speed_preprocess': round(preprocess_time, 6),
             'speed_inference': round(inference_time, 6),
             'speed_postprocess': round(postprocess_time, 6)
-        }), 200
+        }
+        if multi_person:
+            # Per-crop timing of the multi-person cascade
+            response['crops'] = result['crops']
         
+        # Return success response
+        return json_response(response, 200, {'X-Cache': 'HIT' if result['cache_hit'] else 'MISS',
+                                             'X-Model': result['model']})
+        
+    except RequestAbandoned as e:
+        logger.info(f"Pose detection {request_id} abandoned: {e}")
+        return abandoned_response(e, request_id)
+    except AdmissionRejected as e:
+        return overloaded_response(e, request_id)
     except Exception as e:
         ERROR_COUNT.labels(error_type='internal_error').inc()
         logger.error(f"Pose detection error: {e}")
@@ -404,9 +1426,11 @@ def pose_detection():
         # Get request ID (if possible)
         request_id = None
         try:
-            data = request.get_json()
+            data = request.get_json(silent=True)
             if data and 'id' in data:
                 request_id = data['id']
+            else:
+                request_id = request.form.get('id') or header_request_id()
         except:
             pass
         
@@ -424,45 +1448,23 @@ def pose_detection():
         return jsonify(response), 500
 
 @app.route('/api/pose_estimation_image', methods=['POST'])
+@with_deadline
+@admission_controlled
 def pose_estimation_image():
     """Pose detection image API endpoint - returns annotated image"""
     REQUEST_COUNT.labels(method='POST', endpoint='/api/pose_estimation_image').inc()
     
-    start_time = time.time()
     preprocess_time = 0
     inference_time = 0
     postprocess_time = 0
     
     try:
-        # Validate request content type
-        if not request.is_json:
-            ERROR_COUNT.labels(error_type='invalid_content_type').inc()
-            return jsonify({
-                'status': 'error',
-                'message': 'Content-Type must be application/json'
-            }), 400
-        
-        # Get request data
-        data = request.get_json()
-        
-        # Validate required parameters
-        if not data or 'image' not in data or 'id' not in data:
-            ERROR_COUNT.labels(error_type='missing_parameters').inc()
-            return jsonify({
-                'status': 'error',
-                'message': 'Required parameters "image" and "id" are missing'
-            }), 400
-        
-        image_data = data['image']
-        request_id = data['id']
-        
-        # Validate parameter types
-        if not isinstance(image_data, str) or not isinstance(request_id, str):
-            ERROR_COUNT.labels(error_type='invalid_parameter_type').inc()
-            return jsonify({
-                'status': 'error',
-                'message': 'Parameters "image" and "id" must be strings'
-            }), 400
+        # Parse JSON, binary or multipart request
+        parse_start = time.time()
+        request_id, image_data, error = parse_pose_request()
+        record_stage_times(parse=time.time() - parse_start)
+        if error is not None:
+            return error
         
         # Check if model is loaded
         if not model_loaded:
@@ -473,12 +1475,19 @@ def pose_estimation_image():
                 'message': 'Model not loaded'
             }), 503
         
-        # Preprocessing stage
-        preprocess_start = time.time()
+        multi_person, max_crops, error = multi_person_options()
+        if error is not None:
+            return error
+        
+        image_format, quality, max_dimension, error = output_image_options()
+        if error is not None:
+            return error
         
-        # Decode image
-        image_array = decode_base64_image(image_data)
-        if image_array is None:
+        # Preprocessing and inference stages
+        result = process_image_payload(image_data, keep_image=True, multi_person=multi_person,
+                                       max_crops=max_crops, max_dimension=max_dimension, variant=select_model(),
+                                       deadline=current_deadline())
+        if result is None:
             ERROR_COUNT.labels(error_type='invalid_image').inc()
             return jsonify({
                 'status': 'error',
@@ -486,25 +1495,30 @@ def pose_estimation_image():
                 'message': 'Invalid image format or corrupted data'
             }), 400
         
-        preprocess_time = time.time() - preprocess_start
-        
-        # Inference stage
-        inference_start = time.time()
-        
-        # Detect persons
-        persons = detect_persons(image_array)
-        
-        inference_time = time.time() - inference_start
+        persons = result['persons']
+        preprocess_time = result['preprocess_time']
+        inference_time = result['inference_time']
+        image_array = result['image']
         
         # Postprocessing stage
         postprocess_start = time.time()
         
-        # Draw pose on image
-        annotated_image = draw_pose_on_image(image_array, persons)
+        # Nobody is waiting for an image that can no longer be delivered in time
+        current_deadline().check('encode')
         
-        # Encode to base64
-        annotated_image_base64 = encode_image_to_base64(annotated_image)
-        if annotated_image_base64 is None:
+        # Shrink to the requested preview size before drawing
+        image_array = resize_to_max_dimension(image_array, max_dimension)
+        
+        # Draw pose on image (the decoded image is not needed afterwards)
+        annotated_image = draw_pose_on_image(image_array, persons, result['original_shape'], in_place=True)
+        
+        # Encode to raw image bytes or base64
+        binary_response = wants_binary_image()
+        if binary_response:
+            encoded_image = encode_image(annotated_image, image_format, quality, in_place=True)
+        else:
+            encoded_image = encode_image_to_base64(annotated_image, image_format, quality, in_place=True)
+        if encoded_image is None:
             ERROR_COUNT.labels(error_type='image_encoding_failed').inc()
             return jsonify({
                 'status': 'error',
@@ -517,18 +1531,36 @@ def pose_estimation_image():
         # Record successful pose detection
         POSE_DETECTION_COUNT.inc()
         
-        # Record request duration
-        REQUEST_DURATION.observe(time.time() - start_time)
+        record_stage_times(decode=preprocess_time, **inference_stages(inference_time), render=postprocess_time)
+        
+        if binary_response:
+            # Return the raw JPEG with timings in headers
+            return encoded_image, 200, {
+                'Content-Type': IMAGE_FORMATS[image_format][1],
+                'X-Request-ID': request_id,
+                'X-Speed-Preprocess': f"{preprocess_time:.6f}",
+                'X-Speed-Inference': f"{inference_time:.6f}",
+                'X-Speed-Postprocess': f"{postprocess_time:.6f}",
+                'X-Cache': 'HIT' if result['cache_hit'] else 'MISS',
+                'X-Model': result['model']
+            }
         
         # Return success response
-        return jsonify({
+        return json_response({
             'id': request_id,
-            'annotated_image': annotated_image_base64,
+            'annotated_image': encoded_image,
+            'format': image_format,
+            'model': result['model'],
             'speed_preprocess': round(preprocess_time, 6),
             'speed_inference': round(inference_time, 6),
             'speed_postprocess': round(postprocess_time, 6)
-        }), 200
+        }, 200, {'X-Cache': 'HIT' if result['cache_hit'] else 'MISS', 'X-Model': result['model']})
         
+    except RequestAbandoned as e:
+        logger.info(f"Pose estimation image {request_id} abandoned: {e}")
+        return abandoned_response(e, request_id)
+    except AdmissionRejected as e:
+        return overloaded_response(e, request_id)
     except Exception as e:
         ERROR_COUNT.labels(error_type='internal_error').inc()
         logger.error(f"Pose estimation image error: {e}")
@@ -537,9 +1569,11 @@ def pose_estimation_image():
         # Get request ID (if possible)
         request_id = None
         try:
-            data = request.get_json()
+            data = request.get_json(silent=True)
             if data and 'id' in data:
                 request_id = data['id']
+            else:
+                request_id = request.form.get('id') or header_request_id()
         except:
             pass
         
@@ -556,9 +1590,333 @@ def pose_estimation_image():
             
         return jsonify(response), 500
 
+@app.route('/api/pose_detection_batch', methods=['POST'])
+@with_deadline
+@admission_controlled
+def pose_detection_batch():
+    """Batch pose detection API endpoint - returns JSON data for each image"""
+    REQUEST_COUNT.labels(method='POST', endpoint='/api/pose_detection_batch').inc()
+    
+    preprocess_time = 0
+    inference_time = 0
+    postprocess_time = 0
+    
+    try:
+        # Validate request content type
+        if not request.is_json:
+            return error_response('Content-Type must be application/json', 400, 'invalid_content_type')
+        
+        # Get request data
+        parse_start = time.time()
+        data = request.get_json()
+        record_stage_times(parse=time.time() - parse_start)
+        items = data.get('images') if isinstance(data, dict) else None
+        
+        # Validate required parameters
+        if not isinstance(items, list) or not items:
+            return error_response('Required parameter "images" must be a non-empty list of {"id", "image"} objects',
+                                  400, 'missing_parameters')
+        if len(items) > BATCH_ENDPOINT_MAX_ITEMS:
+            return error_response(f'At most {BATCH_ENDPOINT_MAX_ITEMS} images are accepted per batch',
+                                  413, 'batch_too_large')
+        
+        # Check if model is loaded
+        if not model_loaded:
+            return error_response('Model not loaded', 503, 'model_not_loaded')
+        
+        # Preprocessing stage
+        current_deadline().check('decode')
+        preprocess_start = time.time()
+        input_height, input_width = (int(v) for v in interpreter_pool.input_details[0]['shape'][1:3])
+        min_size = max(input_height, input_width) if REDUCED_DECODE_ENABLED else None
+        
+        def load_item(item):
+            """Validate one item, decode its base64 payload and check the cache"""
+            item_start = time.time()
+            if not isinstance(item, dict) or not isinstance(item.get('id'), str) \
+                    or not isinstance(item.get('image'), str):
+                return {'id': item.get('id') if isinstance(item, dict) else None,
+                        'error': 'Parameters "image" and "id" must be strings'}
+            
+            state = {'id': item['id']}
+            payload_key = None
+            if result_cache is not None:
+                payload_key = 'payload:' + content_key(item['image'].encode('utf-8', 'surrogatepass'))
+                state['persons'] = result_cache.get(payload_key, lookup='payload')
+            if state.get('persons') is None:
+                state['bytes'] = decode_base64_payload(item['image'])
+                if state['bytes'] is None:
+                    return {'id': item['id'], 'error': 'Invalid image format or corrupted data'}
+                state['image_key'] = 'image:' + content_key(state['bytes'])
+                state['aliases'] = [payload_key] if payload_key else []
+                if result_cache is not None:
+                    state['persons'] = result_cache.get(state['image_key'], lookup='content')
+            state['preprocess_time'] = time.time() - item_start
+            return state
+        
+        states = list(decode_executor.map(load_item, items))
+        
+        # One tensor slot per distinct image that still needs inference
+        slots = {}
+        for state in states:
+            if 'error' not in state and state.get('persons') is None:
+                slots.setdefault(state['image_key'], len(slots))
+        if slots:
+            # One admission slot per image that needs inference
+            admit(len(slots))
+        resized_batch = np.empty((len(slots), input_height, input_width, 3), dtype=np.uint8)
+        
+        def decode_into_slot(state):
+            """Decode one image and resize it into its slot of the batch tensor"""
+            item_start = time.time()
+            image_array, original_shape = decode_image_bytes(state.pop('bytes'), min_size=min_size)
+            if image_array is None:
+                state['error'] = 'Invalid image format or corrupted data'
+            else:
+                state['original_shape'] = original_shape
+                IMAGE_MEGAPIXELS.observe(original_shape[0] * original_shape[1] / 1e6)
+                cv2.resize(image_array, (input_width, input_height), dst=resized_batch[slots[state['image_key']]])
+            state['preprocess_time'] += time.time() - item_start
+        
+        # Decode each distinct image once, in parallel
+        first_states = {}
+        for state in states:
+            if state.get('image_key') in slots and 'error' not in state and state.get('persons') is None:
+                first_states.setdefault(state['image_key'], state)
+        list(decode_executor.map(decode_into_slot, first_states.values()))
+        
+        # Batch only the images that decoded, keeping their order
+        valid_slots = {}
+        for key in slots:
+            if 'error' not in first_states[key]:
+                valid_slots[key] = len(valid_slots)
+        if len(valid_slots) != len(slots):
+            resized_batch = resized_batch[[slots[key] for key in valid_slots]]
+        
+        # Normalize the whole batch to [0,1] in one vectorized pass
+        input_data = np.empty(resized_batch.shape, dtype=np.float32)
+        np.multiply(resized_batch, np.float32(1.0 / 255.0), out=input_data)
+        
+        preprocess_time = time.time() - preprocess_start
+        
+        # Inference stage
+        inference_start = time.time()
+        slot_keypoints, slot_times = None, []
+        if valid_slots:
+            slot_keypoints, slot_times = run_batch_inference(input_data, deadline=current_deadline())
+        inference_time = time.time() - inference_start
+        
+        # Postprocessing stage
+        postprocess_start = time.time()
+        if valid_slots:
+            # Boxes for every inferred image in one vectorized pass
+            slot_shapes = [first_states[key]['original_shape'] for key in valid_slots]
+            slot_persons = persons_from_keypoints(slot_keypoints, slot_shapes)
+        results = []
+        for state in states:
+            item_start = time.time()
+            item_inference_time = 0.0
+            if 'error' not in state and state.get('persons') is None:
+                first = first_states[state['image_key']]
+                if 'error' in first:
+                    state['error'] = first['error']
+                elif 'persons' in first and first['persons'] is not None:
+                    state['persons'] = first['persons']
+                else:
+                    slot = valid_slots[state['image_key']]
+                    first['persons'] = slot_persons[slot]
+                    state['persons'] = first['persons']
+                    item_inference_time = slot_times[slot]
+                    if result_cache is not None:
+                        result_cache.put(state['image_key'], state['persons'], aliases=state['aliases'])
+            
+            if 'error' in state:
+                ERROR_COUNT.labels(error_type='invalid_image').inc()
+                results.append({'id': state['id'], 'status': 'error', 'message': state['error']})
+                continue
+            
+            persons = state['persons']
+            boxes, keypoints = serialize_persons(persons)
+            results.append({
+                'id': state['id'],
+                'count': len(persons),
+                'boxes': boxes,
+                'keypoints': keypoints,
+                'speed_preprocess': round(state['preprocess_time'], 6),
+                'speed_inference': round(item_inference_time, 6),
+                'speed_postprocess': round(time.time() - item_start, 6)
+            })
+            POSE_DETECTION_COUNT.inc()
+        
+        postprocess_time = time.time() - postprocess_start
+        
+        record_stage_times(decode=preprocess_time, **inference_stages(inference_time), render=postprocess_time)
+        
+        # Return success response
+        return json_response({
+            'count': len(results),
+            'results': results,
+            'model': model_names[FULL],
+            'speed_preprocess': round(preprocess_time, 6),
+            'speed_inference': round(inference_time, 6),
+            'speed_postprocess': round(postprocess_time, 6)
+        })
+        
+    except RequestAbandoned as e:
+        logger.info(f"Batch pose detection abandoned: {e}")
+        return abandoned_response(e)
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    except Exception as e:
+        ERROR_COUNT.labels(error_type='internal_error').inc()
+        logger.error(f"Batch pose detection error: {e}")
+        logger.error(traceback.format_exc())
+        
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error during batch pose detection',
+            'speed_preprocess': round(preprocess_time, 6),
+            'speed_inference': round(inference_time, 6),
+            'speed_postprocess': round(postprocess_time, 6)
+        }), 500
+
+def check_profiling_token():
+    """Error response unless profiling is enabled and the request carries its token"""
+    if not PROFILING_TOKEN:
+        return error_response('Not found', 404, 'not_found')
+    if not hmac.compare_digest(request.headers.get('X-Profiling-Token', ''), PROFILING_TOKEN):
+        return error_response('Invalid profiling token', 403, 'profiling_forbidden')
+    return None
+
+@app.route('/debug/profile', methods=['POST'])
+def debug_profile():
+    """Profile the next N pose requests or a time window of this worker and return the result
+    
+    Parameters (JSON body or query string): mode ("sample", the default, for
+    the all-threads stack sampler or "cprofile"), requests (stop after this
+    many pose requests), duration (seconds, default 10 without requests),
+    interval_ms (sampling interval), format ("json", "collapsed" stacks for
+    flamegraph.pl/speedscope in sample mode, or "pstats" text in cprofile
+    mode), top and include_idle.
+    """
+    global profiling_session
+    forbidden = check_profiling_token()
+    if forbidden is not None:
+        return forbidden
+    
+    mode = request_option('mode', SAMPLE)
+    output = request_option('format', 'json')
+    if mode not in (SAMPLE, CPROFILE):
+        return error_response('Parameter "mode" must be "sample" or "cprofile"', 400, 'invalid_parameter_type')
+    if output not in ('json', 'collapsed', 'pstats') or (output, mode) in (('collapsed', CPROFILE), ('pstats', SAMPLE)):
+        return error_response('Parameter "format" must be "json", "collapsed" (sample mode) or "pstats" '
+                              '(cprofile mode)', 400, 'invalid_parameter_type')
+    try:
+        max_requests = request_option('requests')
+        max_requests = int(max_requests) if max_requests is not None else None
+        duration = request_option('duration')
+        duration = float(duration) if duration is not None else (None if max_requests else 10.0)
+        interval = float(request_option('interval_ms', 5)) / 1000.0
+        top = int(request_option('top', 30))
+        if (max_requests is not None and max_requests < 1) or (duration is not None and duration <= 0) \
+                or interval <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return error_response('Parameters "requests", "duration", "interval_ms" and "top" must be positive numbers',
+                              400, 'invalid_parameter_type')
+    
+    session = ProfilingSession(
+        mode,
+        max_requests=max_requests,
+        duration=min(duration, PROFILING_MAX_SECONDS) if duration is not None else None,
+        interval=interval,
+        functions=HOT_PATH_FUNCTIONS,
+        include_idle=flag_option('include_idle')
+    )
+    with profiling_lock:
+        if profiling_session is not None:
+            return error_response('A profiling session is already running', 409, 'profiling_busy')
+        profiling_session = session
+    try:
+        session.start()
+        session.wait(PROFILING_MAX_SECONDS)
+    finally:
+        with profiling_lock:
+            profiling_session = None
+    logger.info(f"Profiling session ({mode}) finished: {session.requests} request(s) "
+                f"in {session.elapsed:.1f}s")
+    
+    if output == 'collapsed':
+        return session.collapsed(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    if output == 'pstats':
+        return session.pstats_text(top), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return jsonify(session.summary(top)), 200
+
+@app.route('/debug/model', methods=['GET', 'POST'])
+def debug_model():
+    """Report operator placement (XNNPACK or builtin kernels), arena size and invoke times of a loaded model
+    
+    Parameters (JSON body or query string): model ("full" or "light"),
+    threads (comma-separated thread counts, default the configured one),
+    kernels (comma-separated from "xnnpack", "builtin" and "reference",
+    default "xnnpack,builtin"), iterations, format ("json" or "text") and
+    ops (include the per-operator list). The interpreters are created just
+    for the report and compete with requests for CPU while it runs; uses
+    the profiling token.
+    """
+    forbidden = check_profiling_token()
+    if forbidden is not None:
+        return forbidden
+    if not model_loaded:
+        return error_response('Model not loaded', 503, 'model_not_loaded')
+    
+    variant = request_option('model', FULL)
+    if variant not in (FULL, LIGHT) or (variant == LIGHT and light_pool is None):
+        return error_response('Parameter "model" must be "full" or, with a light model configured, "light"',
+                              400, 'invalid_parameter_type')
+    output = request_option('format', 'json')
+    if output not in ('json', 'text'):
+        return error_response('Parameter "format" must be "json" or "text"', 400, 'invalid_parameter_type')
+    kernel_sets = [k.strip() for k in str(request_option('kernels', f"{XNNPACK},{BUILTIN}")).split(',') if k.strip()]
+    if not kernel_sets or any(kernels not in OP_RESOLVERS for kernels in kernel_sets):
+        return error_response(f'Parameter "kernels" must list some of {", ".join(OP_RESOLVERS)}', 400,
+                              'invalid_parameter_type')
+    try:
+        threads = request_option('threads')
+        thread_counts = [int(t) for t in str(threads).split(',')] if threads is not None \
+            else [THREAD_CONFIG.get('tflite_threads', 1)]
+        iterations = int(request_option('iterations', 20))
+        if iterations < 1 or any(t < 1 for t in thread_counts):
+            raise ValueError
+    except (TypeError, ValueError):
+        return error_response('Parameters "threads" and "iterations" must be positive integers', 400,
+                              'invalid_parameter_type')
+    
+    model_path = LIGHT_MODEL_PATH if variant == LIGHT \
+        else os.environ.get('MODEL_PATH', '/app/model/movenet-full-256.tflite')
+    try:
+        report = model_report(runtime, model_path, thread_counts, kernel_sets, iterations)
+    except ValueError as e:
+        return error_response(str(e), 400, 'unsupported_runtime')
+    if not flag_option('ops'):
+        report.pop('ops')
+    if output == 'text':
+        text = format_report(report, show_ops='ops' in report)
+        return text + '\n', 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return jsonify(report), 200
+
 @app.route('/metrics', methods=['GET'])
 def metrics():
-    """Prometheus monitoring metrics endpoint"""
+    """Prometheus monitoring metrics endpoint
+    
+    Under gunicorn with PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py)
+    the metrics of all workers are aggregated, whichever worker answers.
+    """
+    process_memory()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), 200, {'Content-Type': CONTENT_TYPE_LATEST}
     return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
 
 @app.route('/', methods=['GET'])
@@ -595,6 +1953,8 @@ def api_documentation():
 }</pre>
             </div>
             
+            <p>Optional: <code>"multi_person": true</code> runs a batched crop cascade to detect several persons; <code>"max_crops"</code> bounds the number of crops. The response then includes a <code>crops</code> list with per-crop timing.</p>
+            
             <h3>Response Example:</h3>
             <div class="code">
                 <pre>{
@@ -606,6 +1966,7 @@ def api_documentation():
   "keypoints": [
     [[0.45, 0.32, 0.89], [0.43, 0.31, 0.92], ...]
   ],
+  "model": "movenet-full-256",
   "speed_preprocess": 0.012,
   "speed_inference": 0.045,
   "speed_postprocess": 0.008
@@ -621,7 +1982,10 @@ def api_documentation():
             <div class="code">
                 <pre>{
   "image": "base64 encoded image data",
-  "id": "unique request identifier"
+  "id": "unique request identifier",
+  "format": "jpeg | webp | png (optional)",
+  "quality": "1-100 (optional)",
+  "max_dimension": "longest side of the output in pixels (optional)"
 }</pre>
             </div>
             
@@ -630,6 +1994,8 @@ def api_documentation():
                 <pre>{
   "id": "550e8400-e29b-41d4-a716-446655440000",
   "annotated_image": "base64 encoded annotated image",
+  "format": "jpeg",
+  "model": "movenet-full-256",
   "speed_preprocess": 0.012,
   "speed_inference": 0.045,
   "speed_postprocess": 0.008
@@ -637,6 +2003,42 @@ def api_documentation():
             </div>
         </div>
         
+        <div class="endpoint">
+            <h2><span class="method">POST</span> /api/pose_detection_batch</h2>
+            <p>Perform pose detection on a list of images with batched inference, return per-image results and aggregate processing time statistics</p>
+            
+            <h3>Request Parameters:</h3>
+            <div class="code">
+                <pre>{
+  "images": [
+    {"id": "unique request identifier", "image": "base64 encoded image data"},
+    ...
+  ]
+}</pre>
+            </div>
+            
+            <h3>Response Example:</h3>
+            <div class="code">
+                <pre>{
+  "count": 2,
+  "results": [
+    {"id": "img-1", "count": 1, "boxes": [...], "keypoints": [...],
+     "speed_preprocess": 0.004, "speed_inference": 0.006, "speed_postprocess": 0.0001},
+    {"id": "img-2", "status": "error", "message": "Invalid image format or corrupted data"}
+  ],
+  "speed_preprocess": 0.009,
+  "speed_inference": 0.012,
+  "speed_postprocess": 0.0003
+}</pre>
+            </div>
+        </div>
+        
+        <div class="endpoint">
+            <h2>Binary Uploads and Downloads</h2>
+            <p>Both POST endpoints also accept a raw image body (<code>application/octet-stream</code>, <code>image/jpeg</code>, <code>image/png</code>) or a <code>multipart/form-data</code> upload with an <code>image</code> file field. The id is read from the <code>X-Request-ID</code> header, the <code>id</code> query parameter or an <code>id</code> form field.</p>
+            <p>Send <code>Accept: image/jpeg</code> (or <code>?response=image</code>) to <code>/api/pose_estimation_image</code> to receive the annotated image as raw JPEG; the timings are returned in the <code>X-Speed-Preprocess</code>, <code>X-Speed-Inference</code> and <code>X-Speed-Postprocess</code> headers.</p>
+        </div>
+        
         <div class="endpoint">
             <h2><span class="method">GET</span> /health</h2>
             <p>Check service health status and system resources</p>
@@ -656,6 +2058,19 @@ def api_documentation():
             </div>
         </div>
         
+        <div class="endpoint">
+            <h2><span class="method">GET</span> /live, /ready</h2>
+            <p>Liveness and readiness probes. <code>/ready</code> answers 503 until the model is loaded and warmed up, and while admission control is saturated. Both are also served on <code>PROBE_PORT</code> from a separate thread, so they respond while every request worker is busy.</p>
+            
+            <h3>Response Example:</h3>
+            <div class="code">
+                <pre>{
+  "status": "ready",
+  "checks": {"model_loaded": true, "warmed_up": true, "admission": true}
+}</pre>
+            </div>
+        </div>
+        
         <div class="endpoint">
             <h2><span class="method">GET</span> /metrics</h2>
             <p>Prometheus monitoring metrics endpoint</p>
@@ -694,9 +2109,11 @@ if __name__ == '__main__':
     # Load model at startup
     logger.info("Starting CloudPose API server v2.0...")
     if load_model():
+        warm_up_model()
         logger.info("Model loaded successfully, starting server")
     else:
         logger.warning("Model loading failed, server will start but pose detection will not work")
+    start_worker_threads()
     
     # Start Flask application
     app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+CloudPose ASGI Entry Point
+
+Serves the Flask application from an asyncio event loop: request bodies are
+read asynchronously, so slow uploads and idle keep-alive connections cost no
+worker thread, and only complete requests are handed to a bounded thread pool
+that runs the (CPU bound) decode/inference/encode work.
+
+Usage:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+"""
+
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import app as cloudpose
+from admission import ADMISSION_SHED
+from interpreter_pool import available_cpu_count
+
+logger = logging.getLogger(__name__)
+
+# Threads running request handlers (0 = two per available core)
+ASGI_WORKER_THREADS = int(os.environ.get('ASGI_WORKER_THREADS', '0'))
+# Largest request body accepted before the handler runs: a base64-encoded image of the
+# recommended 2 MB maximum in JSON, with room to spare (raise it for large batches)
+ASGI_MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', str(4 * 1024 * 1024)))
+
+# Requests being read or handed to the request threads (running or waiting for one)
+# before further /api/ requests get 429 on the event loop, without reading their body
+# (0 = ADMISSION_MAX_CONCURRENCY plus ADMISSION_MAX_QUEUE): the executor queue sits in
+# front of admission control, so overload has to be shed here and buffered bodies stay
+# bounded. Off when admission control is disabled
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', '0')) \
+    or cloudpose.ADMISSION_MAX_CONCURRENCY + cloudpose.ADMISSION_MAX_QUEUE
+
+PROBES = {'/live': cloudpose.liveness, '/ready': cloudpose.readiness}
+
+request_executor = ThreadPoolExecutor(max_workers=ASGI_WORKER_THREADS or 2 * available_cpu_count(),
+                                      thread_name_prefix='request')
+
+# Requests whose body is being read or that wait for or run in request_executor (event loop only)
+pending_requests = 0
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and its buffered body into a WSGI environ"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+
+    return environ
+
+
+def run_wsgi(environ):
+    """Run the Flask app for one request and return (status, headers, body)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+
+    chunks = cloudpose.app.wsgi_app(environ, start_response)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return response['status'], response['headers'], body
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds ASGI_MAX_BODY_BYTES"""
+
+
+async def read_body(receive):
+    """Read the whole request body without holding a thread; None if the client left"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > ASGI_MAX_BODY_BYTES:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def watch_disconnect(receive, disconnected):
+    """Flag the request as abandoned once the client disconnects"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def backlog_full(scope):
+    """Whether an /api/ request is shed because ASGI_MAX_PENDING requests are pending"""
+    return cloudpose.admission is not None and scope['path'].startswith('/api/') \
+        and pending_requests >= ASGI_MAX_PENDING
+
+
+async def send_overloaded(send):
+    """429 with Retry-After (as admission control answers) for a request shed on the event loop"""
+    retry_after = max(1, math.ceil(cloudpose.admission.estimated_wait(pending_requests)))
+    ADMISSION_SHED.labels(reason='backlog').inc()
+    cloudpose.ERROR_COUNT.labels(error_type='overloaded').inc()
+    body = json.dumps({'status': 'error', 'message': f'Server overloaded, retry after {retry_after}s'})
+    await send_response(send, 429, [(b'content-type', b'application/json'),
+                                    (b'retry-after', str(retry_after).encode('latin-1'))], body.encode('utf-8'))
+
+
+async def handle_lifespan(receive, send):
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if not cloudpose.model_loaded:
+                logger.info("Starting CloudPose API server v2.0 (ASGI)...")
+                if await loop.run_in_executor(request_executor, cloudpose.load_model):
+                    await loop.run_in_executor(request_executor, cloudpose.warm_up_model)
+                else:
+                    logger.warning("Model loading failed, server will start but pose detection will not work")
+            cloudpose.start_worker_threads()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            request_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application wrapping the CloudPose Flask app"""
+    global pending_requests
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    # Probes are answered on the event loop, never queued behind request threads
+    probe = PROBES.get(scope['path']) if scope['method'] == 'GET' else None
+    if probe is not None:
+        status, body = probe()
+        await send_response(send, status, [(b'content-type', b'application/json')],
+                            json.dumps(body).encode('utf-8'))
+        return
+
+    # Shed before buffering the body, so memory does not grow with the backlog
+    if backlog_full(scope):
+        await send_overloaded(send)
+        return
+    pending_requests += 1
+    try:
+        await handle_request(scope, receive, send)
+    finally:
+        pending_requests -= 1
+
+
+async def handle_request(scope, receive, send):
+    """Read the body of an HTTP request and run it on the request threads"""
+    try:
+        body = await read_body(receive)
+    except BodyTooLarge:
+        await send_response(send, 413, [(b'content-type', b'text/plain')], b'Request body too large')
+        return
+    if body is None:
+        # Client went away before the request was complete
+        return
+
+    # Let the handler notice a client that gives up while its request is queued or running
+    environ = build_environ(scope, body)
+    disconnected = threading.Event()
+    environ['cloudpose.disconnected'] = disconnected
+    watcher = asyncio.ensure_future(watch_disconnect(receive, disconnected))
+
+    loop = asyncio.get_running_loop()
+    try:
+        status, headers, response_body = await loop.run_in_executor(request_executor, run_wsgi, environ)
+    finally:
+        watcher.cancel()
+    if disconnected.is_set():
+        return
+    await send_response(send, status, headers, response_body)
@@ -0,0 +1,196 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+BATCH_SIZE = Histogram(
+    'cloudpose_batch_size',
+    'Number of requests served by one batched invoke',
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+)
+BATCH_QUEUE_WAIT = Histogram(
+    'cloudpose_batch_queue_wait_seconds',
+    'Time a request waited in the batching queue before its batch started',
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+BATCH_PADDING = Counter('cloudpose_batch_padding_slots_total', 'Unused batch slots filled with padding')
+
+
+def supported_batch_sizes(max_batch_size):
+    """Batch dimensions the scheduler runs with: powers of two up to the max
+
+    Padding each batch up to one of a few fixed sizes keeps interpreters from
+    reallocating their tensor arena for every distinct batch size.
+    """
+    sizes = []
+    size = 1
+    while size < max_batch_size:
+        sizes.append(size)
+        size *= 2
+    sizes.append(max_batch_size)
+    return sizes
+
+
+class _PendingRequest:
+    __slots__ = ('input_data', 'future', 'enqueued_at', 'started_at', 'deadline')
+
+    def __init__(self, input_data, deadline=None):
+        self.input_data = input_data
+        self.deadline = deadline
+        self.future = Future()
+        self.enqueued_at = time.time()
+        self.started_at = None
+
+
+class MicroBatcher:
+    """Collects concurrent inference requests into batched interpreter invokes
+
+    A single collector thread builds each batch: it is closed once it holds
+    max_batch_size requests or once the oldest request has waited max_wait
+    seconds, and keeps filling up while every interpreter is busy. The whole
+    batch then goes to one of pool.size runner threads, each holding one
+    interpreter for the invoke.
+    """
+
+    def __init__(self, pool, max_batch_size=8, max_wait=0.005, checkout_timeout=None):
+        self.pool = pool
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.checkout_timeout = checkout_timeout
+        self.batch_sizes = supported_batch_sizes(self.max_batch_size)
+
+        self._queue = queue.Queue()
+        self._collecting = 0
+        # One runner per interpreter; a batch is only handed over once one is free
+        self._free_runners = threading.Semaphore(pool.size)
+        self._runners = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix='batcher')
+        self._buffers = threading.local()
+        self._collector = threading.Thread(target=self._collect_loop, name='batcher-collector', daemon=True)
+        self._collector.start()
+
+        logger.info(f"Micro-batching enabled (max batch {self.max_batch_size}, "
+                    f"max wait {self.max_wait * 1000:.1f}ms, {pool.size} runner(s))")
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() + self._collecting
+
+    def submit(self, input_data, deadline=None):
+        """Queue one (H, W, C) input and return a Future for its output row
+
+        With a deadline (see deadline.Deadline), the request is dropped from
+        its batch if it expired or its client left while it was queued.
+        """
+        return self._enqueue(input_data, deadline).future
+
+    def infer(self, input_data, timeout=None, deadline=None):
+        """Run one (H, W, C) input through the next batch and wait for its output
+
+        Returns the output row and the seconds the input waited until its
+        batch held an interpreter.
+        """
+        pending = self._enqueue(input_data, deadline)
+        output = pending.future.result(timeout=timeout)
+        return output, pending.started_at - pending.enqueued_at
+
+    def _enqueue(self, input_data, deadline):
+        pending = _PendingRequest(input_data, deadline)
+        self._queue.put(pending)
+        return pending
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        self._collecting = 1
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            self._collecting = len(batch)
+        return batch
+
+    def _top_up(self, batch):
+        """Add requests that arrived while waiting for a free runner"""
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _collect_loop(self):
+        while True:
+            batch = self._collect_batch()
+            self._free_runners.acquire()
+            batch = self._drop_abandoned(self._top_up(batch))
+            self._collecting = 0
+            if not batch:
+                self._free_runners.release()
+                continue
+            self._runners.submit(self._run_and_release, batch)
+
+    def _run_and_release(self, batch):
+        try:
+            self._run_batch(batch)
+        except Exception as e:
+            logger.error(f"Batched inference failed: {e}")
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+        finally:
+            self._free_runners.release()
+
+    def _drop_abandoned(self, batch):
+        """Fail queued requests whose deadline passed so they don't take a batch slot"""
+        live = []
+        for pending in batch:
+            try:
+                if pending.deadline is not None:
+                    pending.deadline.check('queue')
+                live.append(pending)
+            except Exception as e:
+                pending.future.set_exception(e)
+        return live
+
+    def _run_batch(self, batch):
+        started_at = time.time()
+        for pending in batch:
+            BATCH_QUEUE_WAIT.observe(started_at - pending.enqueued_at)
+        BATCH_SIZE.observe(len(batch))
+
+        # Pad up to the next supported batch size, reusing a per-runner buffer
+        padded_size = next(size for size in self.batch_sizes if size >= len(batch))
+        sample_shape = batch[0].input_data.shape
+        buffers = getattr(self._buffers, 'arrays', None)
+        if buffers is None:
+            buffers = self._buffers.arrays = {}
+        key = (padded_size, sample_shape)
+        if key not in buffers:
+            buffers[key] = np.zeros((padded_size, *sample_shape), dtype=np.float32)
+        input_data = buffers[key]
+        for i, pending in enumerate(batch):
+            input_data[i] = pending.input_data
+        BATCH_PADDING.inc(padded_size - len(batch))
+
+        with self.pool.checkout(timeout=self.checkout_timeout) as interpreter:
+            checked_out_at = time.time()
+            for pending in batch:
+                pending.started_at = checked_out_at
+            output = self.pool.run(interpreter, input_data)
+
+        # Split the (B, 17, 3) output back to each caller
+        output = output.reshape(padded_size, -1, 3)
+        for i, pending in enumerate(batch):
+            pending.future.set_result(output[i])
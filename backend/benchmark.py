@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+CloudPose offline microbenchmarks
+
+Times every stage of the pose pipeline in-process, individually and end to
+end through the Flask test client (no network), over the images in
+inputfolder/ and synthetic images of fixed sizes. Writes median, p95 and MAD
+per stage as JSON, to compare two commits on the same machine.
+
+Usage:
+    # Run from the backend directory (MODEL_PATH as for the service)
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+    python benchmark.py --stages base64_decode,decode_pil,jpeg_encode --synthetic 1920x1080
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Measure the pipeline itself: no cached results, no probe server
+os.environ.setdefault('RESULT_CACHE_MAX_BYTES', '0')
+os.environ.setdefault('PROBE_PORT', '0')
+
+# app must come first: it sizes the OpenCV and BLAS thread pools before they
+# are loaded, so the stages are timed with the service's thread settings
+import app  # noqa: E402
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from postprocess import persons_from_keypoints, serialize_persons  # noqa: E402
+
+logger = logging.getLogger('benchmark')
+
+DEFAULT_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inputfolder')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# Stages in pipeline order; model stages are skipped when no model is loaded
+STAGES = (
+    'base64_decode', 'decode_pil', 'decode_pil_reduced', 'decode_cv2', 'resize_normalize', 'invoke',
+    'postprocess', 'detect_persons', 'draw_pose', 'jpeg_encode', 'json_serialize',
+    'end_to_end_pose_detection', 'end_to_end_pose_estimation_image'
+)
+MODEL_STAGES = ('invoke', 'detect_persons', 'end_to_end_pose_detection', 'end_to_end_pose_estimation_image')
+
+# Model input size assumed for resize_normalize without a model (MoveNet Thunder)
+DEFAULT_INPUT_SHAPE = (256, 256)
+
+
+def summarize(samples):
+    """Median, p95 and median absolute deviation (plus mean, min, max) of timings in seconds"""
+    values = np.asarray(samples, dtype=np.float64)
+    median = float(np.median(values))
+    return {
+        'n': int(values.size),
+        'median': round(median, 9),
+        'p95': round(float(np.percentile(values, 95)), 9),
+        'mad': round(float(np.median(np.abs(values - median))), 9),
+        'mean': round(float(values.mean()), 9),
+        'min': round(float(values.min()), 9),
+        'max': round(float(values.max()), 9)
+    }
+
+
+def measure(func, iterations, warmup):
+    """Call func warmup times untimed, then iterations times; returns the timings in seconds"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def load_folder_images(folder, limit=0):
+    """Encoded image files of a folder, sorted by name: [(name, bytes)]"""
+    names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+    if limit:
+        names = names[:limit]
+    images = []
+    for name in names:
+        with open(os.path.join(folder, name), 'rb') as f:
+            images.append((name, f.read()))
+    return images
+
+
+def synthetic_image(width, height, seed=0, quality=90):
+    """Deterministic JPEG with smooth, photo-like content (upscaled low-resolution noise)"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(2, height // 32), max(2, width // 32), 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    success, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError(f"Could not encode a {width}x{height} synthetic image")
+    return buffer.tobytes()
+
+
+def parse_sizes(value):
+    sizes = []
+    for size in value.split(','):
+        if size.strip():
+            width, height = size.lower().split('x')
+            sizes.append((int(width), int(height)))
+    return sizes
+
+
+def input_shape():
+    if app.model_loaded and app.interpreter_pool is not None:
+        return tuple(int(v) for v in app.interpreter_pool.input_details[0]['shape'][1:3])
+    return DEFAULT_INPUT_SHAPE
+
+
+def prepare(name, image_bytes, shape):
+    """Run the pipeline once to get each stage's input for one image"""
+    item = {'name': name, 'bytes': image_bytes, 'base64': base64.b64encode(image_bytes).decode('ascii')}
+    item['image'], item['original_shape'] = app.decode_image_bytes(image_bytes)
+    if item['image'] is None:
+        return None
+    item['input'] = app.preprocess_image(item['image'], shape)
+    if app.model_loaded:
+        with app.interpreter_pool.checkout() as interpreter:
+            item['keypoints'] = app.interpreter_pool.run(interpreter, item['input'][np.newaxis]).reshape(-1, 3)
+    else:
+        # A fixed plausible skeleton keeps the model-independent stages comparable
+        rng = np.random.default_rng(0)
+        item['keypoints'] = np.column_stack([rng.uniform(0.2, 0.8, (17, 2)), np.full(17, 0.8)]).astype(np.float32)
+    item['persons'] = persons_from_keypoints(item['keypoints'], [item['original_shape']])[0]
+    item['annotated'] = app.draw_pose_on_image(item['image'], item['persons'])
+    boxes, keypoints = serialize_persons(item['persons'])
+    item['response'] = {
+        'id': name,
+        'count': len(item['persons']),
+        'boxes': boxes,
+        'keypoints': keypoints,
+        'model': app.model_names.get(app.FULL, 'none'),
+        'speed_preprocess': 0.0,
+        'speed_inference': 0.0,
+        'speed_postprocess': 0.0
+    }
+    return item
+
+
+def stage_function(stage, item, client, shape):
+    """Zero-argument callable running one stage on a prepared image"""
+    if stage == 'base64_decode':
+        return lambda: app.decode_base64_payload(item['base64'])
+    if stage == 'decode_pil':
+        return lambda: app.decode_image_bytes(item['bytes'])
+    if stage == 'decode_pil_reduced':
+        # Reduced-scale JPEG decode as used by /api/pose_detection
+        return lambda: app.decode_image_bytes(item['bytes'], min_size=max(shape))
+    if stage == 'decode_cv2':
+        return lambda: cv2.cvtColor(cv2.imdecode(np.frombuffer(item['bytes'], np.uint8), cv2.IMREAD_COLOR),
+                                    cv2.COLOR_BGR2RGB)
+    if stage == 'resize_normalize':
+        return lambda: app.preprocess_image(item['image'], shape)
+    if stage == 'invoke':
+        batch = item['input'][np.newaxis]
+
+        def invoke():
+            with app.interpreter_pool.checkout() as interpreter:
+                app.interpreter_pool.run(interpreter, batch)
+        return invoke
+    if stage == 'postprocess':
+        return lambda: persons_from_keypoints(item['keypoints'], [item['original_shape']])
+    if stage == 'detect_persons':
+        return lambda: app.detect_persons(item['image'], item['original_shape'])
+    if stage == 'draw_pose':
+        return lambda: app.draw_pose_on_image(item['image'], item['persons'])
+    if stage == 'jpeg_encode':
+        return lambda: app.encode_image(item['annotated'], 'jpeg', app.ANNOTATED_IMAGE_QUALITY)
+    if stage == 'json_serialize':
+        return lambda: app.app.json.dumps(item['response'])
+    if stage.startswith('end_to_end_'):
+        endpoint = '/api/' + stage[len('end_to_end_'):]
+        payload = {'id': item['name'], 'image': item['base64']}
+
+        def request():
+            response = client.post(endpoint, json=payload)
+            if response.status_code != 200:
+                raise RuntimeError(f"{endpoint} returned {response.status_code} for {item['name']}: "
+                                   f"{response.get_data(as_text=True)[:200]}")
+        return request
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_dataset(images, stages, iterations, warmup):
+    """Time every stage over a list of (name, bytes) images; returns {stage: summary}"""
+    shape = input_shape()
+    client = app.app.test_client()
+    items = [item for item in (prepare(name, data, shape) for name, data in images) if item is not None]
+    if len(items) < len(images):
+        logger.warning(f"Skipped {len(images) - len(items)} image(s) that could not be decoded")
+    results = {}
+    for stage in stages:
+        samples = []
+        for item in items:
+            samples.extend(measure(stage_function(stage, item, client, shape), iterations, warmup))
+        results[stage] = summarize(samples)
+        logger.info(f"  {stage:<34} median {results[stage]['median'] * 1000:9.3f}ms  "
+                    f"p95 {results[stage]['p95'] * 1000:9.3f}ms  mad {results[stage]['mad'] * 1000:8.3f}ms")
+    megapixels = [item['original_shape'][0] * item['original_shape'][1] / 1e6 for item in items]
+    return {
+        'images': len(items),
+        'megapixels': round(float(np.mean(megapixels)), 3) if megapixels else 0.0,
+        'stages': results
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(args, stages):
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': app.available_cpu_count(),
+        'threads': app.THREAD_CONFIG,
+        'runtime': app.runtime.info() if app.runtime is not None else None,
+        'model': app.model_names.get(app.FULL) if app.model_loaded else None,
+        'input_shape': list(input_shape()),
+        'iterations': args.iterations,
+        'warmup': args.warmup,
+        'stages': list(stages)
+    }
+
+
+def compare(baseline, results, stream=sys.stdout):
+    """Print the change of each stage's median against a baseline results file"""
+    print(f"{'dataset':<24} {'stage':<34} {'baseline ms':>12} {'current ms':>12} {'change':>9} {'mads':>7}",
+          file=stream)
+    for dataset, current in results['datasets'].items():
+        previous = baseline.get('datasets', {}).get(dataset)
+        if previous is None:
+            continue
+        for stage, summary in current['stages'].items():
+            before = previous['stages'].get(stage)
+            if before is None:
+                continue
+            change = (summary['median'] - before['median']) / before['median'] if before['median'] else 0.0
+            # Shift of the median in units of the baseline's MAD, to tell a change from noise
+            spread = (summary['median'] - before['median']) / before['mad'] if before['mad'] else float('inf')
+            print(f"{dataset:<24} {stage:<34} {before['median'] * 1000:>12.3f} {summary['median'] * 1000:>12.3f} "
+                  f"{change:>+8.1%} {spread:>+7.1f}", file=stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CloudPose offline pipeline microbenchmarks')
+    parser.add_argument('--images', default=DEFAULT_IMAGES, help='Folder of test images (default: ../inputfolder)')
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many folder images (0 = all)')
+    parser.add_argument('--synthetic', default='640x480,1280x720,1920x1080',
+                        help='Comma-separated WIDTHxHEIGHT sizes of synthetic images ("" for none)')
+    parser.add_argument('--synthetic-count', type=int, default=4, help='Synthetic images per size')
+    parser.add_argument('--iterations', type=int, default=5, help='Timed runs per stage and image')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed runs per stage and image')
+    parser.add_argument('--stages', help=f'Comma-separated subset of: {", ".join(STAGES)}')
+    parser.add_argument('--output', help='Write the JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', help='Results file of a previous run to compare medians against')
+    args = parser.parse_args()
+
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    stages = [s.strip() for s in args.stages.split(',')] if args.stages else list(STAGES)
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(unknown)}")
+
+    if app.load_model():
+        app.warm_up_model()
+    else:
+        skipped = [s for s in stages if s in MODEL_STAGES]
+        stages = [s for s in stages if s not in MODEL_STAGES]
+        if skipped:
+            logger.warning(f"Model not loaded (check MODEL_PATH), skipping: {', '.join(skipped)}")
+
+    datasets = {}
+    if args.images and os.path.isdir(args.images):
+        datasets['inputfolder'] = load_folder_images(args.images, args.limit)
+    elif args.images:
+        logger.warning(f"Image folder not found: {args.images}")
+    for width, height in parse_sizes(args.synthetic):
+        name = f"synthetic_{width}x{height}"
+        datasets[name] = [(f"{name}_{seed}", synthetic_image(width, height, seed))
+                          for seed in range(max(1, args.synthetic_count))]
+
+    results = {'environment': environment(args, stages), 'datasets': {}}
+    for dataset, images in datasets.items():
+        if not images:
+            continue
+        logger.info(f"{dataset}: {len(images)} image(s)")
+        results['datasets'][dataset] = run_dataset(images, stages, max(1, args.iterations), max(0, args.warmup))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            # Keep stdout parseable when the results go there
+            compare(json.load(f), results, sys.stdout if args.output else sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
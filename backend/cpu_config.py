@@ -0,0 +1,151 @@
+import logging
+import math
+import os
+
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+CPU_QUOTA = Gauge('cloudpose_cpu_quota_cores', 'CPU limit applied to the container (0 = unlimited)',
+                  multiprocess_mode='max')
+THREAD_SETTINGS = Gauge('cloudpose_thread_setting', 'Effective thread configuration', ['setting'],
+                        multiprocess_mode='max')
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# Environment variables read by the OpenMP/BLAS runtimes when NumPy and
+# OpenCV are imported
+BLAS_THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_dirs(mount, path):
+    """Directories from the process's own cgroup up to the mount root
+
+    Inside a container the cgroup namespace usually makes the mount root the
+    container's own cgroup, so the root is checked too.
+    """
+    dirs = []
+    path = path.rstrip('/')
+    while path:
+        dirs.append(os.path.join(mount, path.lstrip('/')))
+        path = os.path.dirname(path).rstrip('/')
+    dirs.append(mount)
+    return dirs
+
+
+def _cgroup_v2_quota(path):
+    quotas = []
+    for directory in _cgroup_dirs(CGROUP_ROOT, path):
+        value = _read(os.path.join(directory, 'cpu.max'))
+        if not value:
+            continue
+        quota, _, period = value.partition(' ')
+        if quota != 'max' and int(period or 100000) > 0:
+            quotas.append(int(quota) / int(period or 100000))
+    return min(quotas) if quotas else None
+
+
+def _cgroup_v1_quota(controllers, path):
+    quotas = []
+    for mount in (os.path.join(CGROUP_ROOT, controllers), os.path.join(CGROUP_ROOT, 'cpu')):
+        for directory in _cgroup_dirs(mount, path):
+            quota = _read(os.path.join(directory, 'cpu.cfs_quota_us'))
+            period = _read(os.path.join(directory, 'cpu.cfs_period_us'))
+            if quota and period and int(quota) > 0 and int(period) > 0:
+                quotas.append(int(quota) / int(period))
+    return min(quotas) if quotas else None
+
+
+def cgroup_cpu_quota():
+    """CPU limit in cores from the cgroup v2 or v1 CFS quota, or None if unlimited"""
+    cgroups = _read('/proc/self/cgroup')
+    if not cgroups:
+        return None
+
+    for line in cgroups.splitlines():
+        _, controllers, path = line.split(':', 2)
+        if controllers == '':
+            quota = _cgroup_v2_quota(path)
+        elif 'cpu' in controllers.split(','):
+            quota = _cgroup_v1_quota(controllers, path)
+        else:
+            continue
+        if quota is not None:
+            return quota
+    return None
+
+
+def cpu_limit():
+    """CPU limit in cores: CPU_LIMIT if set, otherwise the cgroup quota (None = unlimited)"""
+    if os.environ.get('CPU_LIMIT'):
+        return float(os.environ['CPU_LIMIT'])
+    try:
+        return cgroup_cpu_quota()
+    except (ValueError, OSError) as e:
+        logger.warning(f"Could not read cgroup CPU quota: {e}")
+        return None
+
+
+def available_cpus():
+    """Cores the container may use: the CPU affinity capped by the CPU limit"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cpu_limit()
+    if limit is not None:
+        # A fractional quota still needs one thread to make progress
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+def process_cpus():
+    """Share of the available cores for this process when WORKER_PROCESSES share them"""
+    processes = max(1, int(os.environ.get('WORKER_PROCESSES', '1')))
+    return max(1, available_cpus() // processes)
+
+
+def configure_threads():
+    """Size the native thread pools of this process from its CPU share
+
+    Must run before NumPy/OpenCV are imported, since OpenMP and OpenBLAS read
+    their thread counts at load time. Variables already set in the
+    environment are left alone. Returns the effective configuration.
+    """
+    limit = cpu_limit()
+    cpus = process_cpus()
+    for name in BLAS_THREAD_VARIABLES:
+        os.environ.setdefault(name, str(cpus))
+
+    config = {
+        'cpu_quota': limit,
+        'available_cpus': available_cpus(),
+        'worker_processes': max(1, int(os.environ.get('WORKER_PROCESSES', '1'))),
+        'process_cpus': cpus,
+        'opencv_threads': int(os.environ.get('OPENCV_NUM_THREADS', str(cpus))),
+    }
+    for name in BLAS_THREAD_VARIABLES:
+        config[name.lower()] = int(os.environ[name])
+
+    CPU_QUOTA.set(limit or 0)
+    for name, value in config.items():
+        if name != 'cpu_quota':
+            THREAD_SETTINGS.labels(setting=name).set(value)
+    logger.info(f"CPU limit {limit if limit is not None else 'none'}, "
+                f"{cpus} core(s) for this process, thread settings: {config}")
+    return config
+
+
+def set_thread_setting(config, name, value):
+    """Record a thread setting decided later (e.g. once the model is loaded)"""
+    config[name] = value
+    THREAD_SETTINGS.labels(setting=name).set(value)
@@ -0,0 +1,89 @@
+import logging
+import socket
+import time
+
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+DEADLINE_EXCEEDED = Counter('cloudpose_deadline_exceeded_total', 'Requests dropped after their deadline passed',
+                            ['stage'])
+CLIENT_DISCONNECTED = Counter('cloudpose_client_disconnected_total', 'Requests abandoned after the client went away',
+                              ['stage'])
+
+
+class RequestAbandoned(Exception):
+    """Base class for requests whose result nobody is waiting for any more"""
+
+    def __init__(self, stage):
+        super().__init__(f"{self.reason} before {stage}")
+        self.stage = stage
+
+
+class DeadlineExceeded(RequestAbandoned):
+    reason = 'Deadline exceeded'
+
+
+class ClientDisconnected(RequestAbandoned):
+    reason = 'Client disconnected'
+
+
+def socket_disconnected(sock):
+    """Whether the peer of a connected socket has closed it
+
+    Peeks without blocking: an orderly shutdown reads as EOF, a reset as an
+    error. Pending data (e.g. a pipelined request) means the client is still
+    there.
+    """
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except (BlockingIOError, InterruptedError):
+        return False
+    except OSError:
+        return True
+
+
+class Deadline:
+    """Expiry time and client liveness of one request
+
+    check() is called between processing stages (decode, queueing, inference,
+    encode) so work nobody will receive is dropped instead of holding an
+    interpreter. expires_at is a time.time() timestamp or None;
+    is_disconnected an optional callable reporting that the client left.
+    """
+
+    __slots__ = ('expires_at', 'is_disconnected')
+
+    def __init__(self, expires_at=None, is_disconnected=None):
+        self.expires_at = expires_at
+        self.is_disconnected = is_disconnected
+
+    def remaining(self):
+        """Seconds left, or None without a deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def timeout(self, default=None):
+        """The smaller of default and the time left (None if both are unbounded)"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    def abandoned(self):
+        """Whether the request expired or its client went away (without counting it)"""
+        return self.expired() or (self.is_disconnected is not None and self.is_disconnected())
+
+    def check(self, stage):
+        """Raise RequestAbandoned if the request expired or its client went away"""
+        if self.expired():
+            DEADLINE_EXCEEDED.labels(stage=stage).inc()
+            raise DeadlineExceeded(stage)
+        if self.is_disconnected is not None and self.is_disconnected():
+            CLIENT_DISCONNECTED.labels(stage=stage).inc()
+            raise ClientDisconnected(stage)
@@ -0,0 +1,107 @@
+"""
+Gunicorn configuration for the CloudPose backend
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The model is loaded in the master before workers are forked (preload_app),
+so the libraries and model weights are shared copy-on-write between workers.
+Each worker restarts its own threads after the fork (see post_fork).
+"""
+
+import glob
+import os
+import sys
+
+# Workers write their metrics to files in PROMETHEUS_MULTIPROC_DIR and /metrics
+# aggregates them (prometheus_client multiprocess mode; set to '' to disable).
+# Must be set before prometheus_client is imported.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/cloudpose-metrics')
+if PROMETHEUS_MULTIPROC_DIR:
+    # Files left by a previous run would be counted too
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, '*.db')):
+        os.remove(path)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cpu_config
+
+# Cores available to the container (cgroup CPU quota aware)
+cpus = cpu_config.available_cpus()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# One worker process per available core (0 = auto), each serving requests
+# from threads that share the worker's interpreter pool; /live and /ready are
+# served on PROBE_PORT by a separate thread, so probes are answered even under load.
+workers = int(os.environ.get('GUNICORN_WORKERS', '0')) or cpus
+worker_class = 'gthread'
+
+# Request threads per worker (0 = auto): one per admission slot and per place
+# in the admission queue, sized as app.py sizes them from the worker's
+# interpreter pool (its share of the cores), plus one spare per interpreter.
+# The spares take excess requests to admission control, which sheds them with
+# 429 at once, and serve cheap endpoints; without them excess requests would
+# wait in gunicorn's own unbounded queue instead.
+pool_size = int(os.environ.get('INTERPRETER_POOL_SIZE', '0')) or max(1, cpus // workers)
+batch_size = int(os.environ.get('BATCH_MAX_SIZE', '8')) \
+    if os.environ.get('BATCHING_ENABLED', 'false').lower() == 'true' else 1
+admission_slots = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '0')) or pool_size * batch_size
+admission_queue = int(os.environ.get('ADMISSION_MAX_QUEUE', '0')) or 4 * admission_slots
+threads = int(os.environ.get('GUNICORN_THREADS', '0')) or admission_slots + admission_queue + pool_size
+
+# Workers split the cores between them when sizing their interpreter and
+# thread pools; read by app.py when the model is preloaded below
+os.environ.setdefault('WORKER_PROCESSES', str(workers))
+
+preload_app = True
+
+# Graceful recycling: restart each worker after a (jittered) number of
+# requests, or once its resident memory grows past WORKER_MAX_RSS_MB
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+WORKER_MAX_RSS_MB = int(os.environ.get('WORKER_MAX_RSS_MB', '0'))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+
+def when_ready(server):
+    # The master only preloads the model; drop its live gauges so they are
+    # not added to the workers' own
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    import app as cloudpose
+    cloudpose.reinit_after_fork()
+
+
+def post_worker_init(worker):
+    import app as cloudpose
+    # The stats sampler and the probes on PROBE_PORT get their own threads in
+    # every worker (never in the master, so none is running at fork time)
+    cloudpose.start_worker_threads()
+    memory = cloudpose.process_memory()
+    worker.log.info("Worker %s ready: %s", worker.pid,
+                    ", ".join(f"{name}={value / 2**20:.1f}MiB" for name, value in memory.items()))
+
+
+def post_request(worker, req, environ, resp):
+    if not WORKER_MAX_RSS_MB:
+        return
+    import psutil
+    rss = psutil.Process().memory_info().rss
+    if rss > WORKER_MAX_RSS_MB * 2**20 and worker.alive:
+        worker.log.info("Worker %s RSS %.1fMiB exceeds %dMiB, recycling", worker.pid, rss / 2**20, WORKER_MAX_RSS_MB)
+        worker.alive = False
@@ -0,0 +1,128 @@
+import json
+import logging
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+SYSTEM_CPU = Gauge('cloudpose_system_cpu_percent', 'System-wide CPU utilisation, as last sampled',
+                   multiprocess_mode='livemax')
+SYSTEM_MEMORY = Gauge('cloudpose_system_memory_percent', 'System-wide memory utilisation, as last sampled',
+                      multiprocess_mode='livemax')
+READY = Gauge('cloudpose_ready', 'Workers that reported ready on their last readiness check',
+              multiprocess_mode='livesum')
+
+
+class SystemSampler:
+    """Samples system CPU/memory (and optionally process stats) on a background thread
+
+    Probes and /health read the cached snapshot instead of calling psutil
+    while a request worker waits. process_sampler is an optional callable
+    whose result is stored under 'process'.
+    """
+
+    def __init__(self, interval=5.0, process_sampler=None):
+        self.interval = interval
+        self.process_sampler = process_sampler
+        self._snapshot = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start (or, in a forked child, restart) the sampling thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        # The first cpu_percent() call only sets the baseline
+        psutil.cpu_percent(interval=None)
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name='system-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"System stats sampling failed: {e}")
+
+    def sample(self):
+        memory = psutil.virtual_memory()
+        snapshot = {
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': memory.percent,
+            'memory_available': memory.available,
+            'sampled_at': time.time()
+        }
+        if self.process_sampler is not None:
+            snapshot['process'] = self.process_sampler()
+        SYSTEM_CPU.set(snapshot['cpu_percent'])
+        SYSTEM_MEMORY.set(snapshot['memory_percent'])
+        self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self):
+        """The latest sample, with its age in seconds"""
+        snapshot = dict(self._snapshot)
+        if snapshot:
+            snapshot['age'] = round(time.time() - snapshot['sampled_at'], 3)
+        return snapshot
+
+
+class _ProbeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        check = self.server.checks.get(self.path.split('?', 1)[0])
+        if check is None:
+            status, body = 404, {'status': 'not found'}
+        else:
+            try:
+                status, body = check()
+            except Exception as e:
+                status, body = 500, {'status': 'error', 'error': str(e)}
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ProbeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Every gunicorn worker binds the probe port; the kernel spreads
+        # probes across them
+        if hasattr(socket, 'SO_REUSEPORT'):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def start_probe_server(port, checks, host='0.0.0.0'):
+    """Serve checks ({path: callable returning (status, body)}) on a separate port
+
+    The probe server runs on its own thread, so Kubernetes probes are
+    answered even while every request worker is busy with inference.
+    Returns the server, or None if the port could not be bound.
+    """
+    try:
+        server = _ProbeHTTPServer((host, port), _ProbeHandler)
+    except OSError as e:
+        logger.error(f"Could not start probe server on port {port}: {e}")
+        return None
+    server.checks = checks
+    threading.Thread(target=server.serve_forever, name='probe-server', daemon=True).start()
+    logger.info(f"Serving {', '.join(sorted(checks))} on port {port}")
+    return server
@@ -0,0 +1,201 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from prometheus_client import Counter, Gauge, Histogram
+
+import cpu_config
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+POOL_SIZE = Gauge('cloudpose_interpreter_pool_size', 'Number of interpreters in the pool',
+                  multiprocess_mode='livesum')
+POOL_IN_USE = Gauge('cloudpose_interpreter_pool_in_use', 'Number of interpreters currently checked out',
+                    multiprocess_mode='livesum')
+POOL_UTILIZATION = Gauge('cloudpose_interpreter_pool_utilization', 'Fraction of pool interpreters currently checked out',
+                         multiprocess_mode='liveall')
+POOL_BUSY_RATIO = Gauge('cloudpose_interpreter_busy_ratio',
+                        'Fraction of interpreter time spent checked out since the previous sample',
+                        multiprocess_mode='liveall')
+POOL_WAIT_TIME = Histogram(
+    'cloudpose_interpreter_pool_wait_seconds',
+    'Time spent waiting to check out an interpreter',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+POOL_BUSY_TIME = Counter('cloudpose_interpreter_busy_seconds_total', 'Total time interpreters spent checked out')
+POOL_TIMEOUTS = Counter('cloudpose_interpreter_pool_timeouts_total', 'Checkouts that gave up waiting for an interpreter')
+
+
+def available_cpu_count():
+    """Return the number of CPUs this process may run on (cgroup quota aware)"""
+    return cpu_config.process_cpus()
+
+
+class PoolTimeout(Exception):
+    """Raised when no interpreter became available within the checkout timeout"""
+
+
+class InterpreterPool:
+    """Fixed-size pool of independently allocated TFLite interpreters
+
+    Each interpreter owns its own tensor arena, so callers holding different
+    interpreters can run set_tensor/invoke/get_tensor concurrently.
+    """
+
+    def __init__(self, factory, size, report_metrics=True):
+        if size < 1:
+            raise ValueError("Interpreter pool size must be at least 1")
+
+        self.size = size
+        # Only one pool per process feeds the pool gauges
+        self._report_metrics = report_metrics
+        self._available = queue.LifoQueue()
+        self._in_use = 0
+        self._waiting = 0
+        self._busy_seconds = 0.0
+        self._busy_sample = (time.time(), 0.0)
+        self._count_lock = threading.Lock()
+        # Current batch dimension of each interpreter's input tensor
+        self._batch_sizes = {}
+
+        # Time spent creating interpreters and allocating their tensors
+        self.create_seconds = 0.0
+        self.allocate_seconds = 0.0
+        for _ in range(size):
+            start = time.time()
+            interpreter = factory()
+            created = time.time()
+            interpreter.allocate_tensors()
+            self.create_seconds += created - start
+            self.allocate_seconds += time.time() - created
+            self._available.put(interpreter)
+
+        # All interpreters come from the same model, so the details are shared
+        sample = self._available.queue[-1]
+        self.input_details = sample.get_input_details()
+        self.output_details = sample.get_output_details()
+
+        for interpreter in self._available.queue:
+            self._batch_sizes[id(interpreter)] = int(self.input_details[0]['shape'][0])
+
+        self.publish_metrics()
+        logger.info(f"Interpreter pool ready with {size} interpreter(s)")
+
+    def publish_metrics(self):
+        """Set the pool gauges (again after a fork, where each process reports its own)"""
+        if self._report_metrics:
+            POOL_SIZE.set(self.size)
+        self._update_usage(0)
+
+    def _update_usage(self, delta):
+        with self._count_lock:
+            self._in_use += delta
+            in_use = self._in_use
+        if self._report_metrics:
+            POOL_IN_USE.set(in_use)
+            POOL_UTILIZATION.set(in_use / self.size)
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    @property
+    def waiting(self):
+        """Number of callers currently waiting for an interpreter"""
+        return self._waiting
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Borrow an interpreter for the duration of the with-block"""
+        wait_start = time.time()
+        with self._count_lock:
+            self._waiting += 1
+        try:
+            interpreter = self._available.get(timeout=timeout)
+        except queue.Empty:
+            POOL_TIMEOUTS.inc()
+            raise PoolTimeout(f"No interpreter available after {timeout}s")
+        finally:
+            with self._count_lock:
+                self._waiting -= 1
+        POOL_WAIT_TIME.observe(time.time() - wait_start)
+
+        self._update_usage(1)
+        busy_start = time.time()
+        try:
+            yield interpreter
+        finally:
+            busy_time = time.time() - busy_start
+            POOL_BUSY_TIME.inc(busy_time)
+            with self._count_lock:
+                self._busy_seconds += busy_time
+            self._update_usage(-1)
+            self._available.put(interpreter)
+
+    def sample_busy_ratio(self):
+        """Fraction of the pool's interpreter time spent checked out since the previous call"""
+        now = time.time()
+        with self._count_lock:
+            sampled_at, sampled_busy = self._busy_sample
+            self._busy_sample = (now, self._busy_seconds)
+            busy = self._busy_seconds - sampled_busy
+        ratio = min(1.0, busy / max(1e-9, (now - sampled_at) * self.size))
+        if self._report_metrics:
+            POOL_BUSY_RATIO.set(ratio)
+        return ratio
+
+    def run(self, interpreter, input_data):
+        """Invoke a checked-out interpreter on a (B, H, W, C) input batch
+
+        The input tensor is resized (and the arena reallocated) only when the
+        batch dimension differs from the one the interpreter last ran with.
+        Returns a copy of the first output tensor.
+        """
+        input_index = self.input_details[0]['index']
+        batch_size = input_data.shape[0]
+        if self._batch_sizes.get(id(interpreter)) != batch_size:
+            interpreter.resize_tensor_input(input_index, [batch_size, *input_data.shape[1:]])
+            interpreter.allocate_tensors()
+            self._batch_sizes[id(interpreter)] = batch_size
+
+        interpreter.set_tensor(input_index, input_data)
+        interpreter.invoke()
+        return interpreter.get_tensor(self.output_details[0]['index']).copy()
+
+    def warm_up(self, batch_sizes=(1,), iterations=1):
+        """Run synthetic inputs through every interpreter at each batch size
+
+        Pays the first-invoke costs (delegate preparation, tensor arena growth)
+        before real requests arrive. Sizes run largest first, so each arena
+        grows to its peak once and the interpreters end up at the smallest
+        size. Returns {batch_size: (first, last)}: the slowest first invoke
+        and the mean invoke time of the last iteration, in seconds.
+        """
+        input_shape = self.input_details[0]['shape'][1:]
+        dtype = self.input_details[0]['dtype']
+        rng = np.random.default_rng(0)
+        iterations = max(1, iterations)
+        timings = {}
+        interpreters = [self._available.get() for _ in range(self.size)]
+        try:
+            for batch_size in sorted(set(batch_sizes), reverse=True):
+                input_data = rng.uniform(0, 255, (batch_size, *input_shape)).astype(dtype)
+                first, last = [], []
+                for interpreter in interpreters:
+                    for i in range(iterations):
+                        start = time.time()
+                        self.run(interpreter, input_data)
+                        elapsed = time.time() - start
+                        if i == 0:
+                            first.append(elapsed)
+                        if i == iterations - 1:
+                            last.append(elapsed)
+                timings[batch_size] = (max(first), sum(last) / len(last))
+        finally:
+            for interpreter in interpreters:
+                self._available.put(interpreter)
+        return timings
@@ -0,0 +1,279 @@
+import logging
+import os
+import time
+from collections import Counter as Tally
+
+import numpy as np
+from prometheus_client import Gauge
+
+from runtime import current_rss
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+MODEL_OPS = Gauge('cloudpose_model_ops', 'Operators of a loaded model by the kernels that run them',
+                  ['model', 'kernels'], multiprocess_mode='max')
+
+XNNPACK = 'xnnpack'
+BUILTIN = 'builtin'
+REFERENCE = 'reference'
+
+# Kernel sets an interpreter can be created with: TFLite's default (optimised
+# builtin kernels with the XNNPACK delegate applied), the optimised builtin
+# kernels alone, and the reference kernels
+OP_RESOLVERS = {
+    XNNPACK: 'AUTO',
+    BUILTIN: 'BUILTIN_WITHOUT_DEFAULT_DELEGATES',
+    REFERENCE: 'BUILTIN_REF',
+}
+
+
+def supports_op_details(interpreter):
+    """Whether the interpreter exposes its operators (TFLite, not the ONNX adapter)"""
+    return hasattr(interpreter, '_get_ops_details')
+
+
+def op_placement(interpreter, kernels=XNNPACK):
+    """Operators of an allocated interpreter and the kernels each one runs on
+
+    Delegates are applied when tensors are allocated: the delegated nodes stay
+    in the graph and a DELEGATE node per partition is appended that takes
+    over the subgraph between its input and output tensors. An operator runs
+    on XNNPACK when it lies inside such a partition, otherwise on the given
+    builtin kernels. Returns (ops, partitions) with ops as a list of
+    {'index', 'op', 'kernels', 'partition'} in graph order.
+    """
+    details = interpreter._get_ops_details()
+    nodes = {op['index']: op for op in details if op['op_name'] != 'DELEGATE'}
+    delegates = [op for op in details if op['op_name'] == 'DELEGATE']
+    producers = {int(tensor): op['index'] for op in nodes.values() for tensor in op['outputs']}
+
+    delegated = {}
+    for partition, delegate in enumerate(delegates):
+        boundary = {int(tensor) for tensor in delegate['inputs']}
+        pending = [int(tensor) for tensor in delegate['outputs']]
+        seen = set()
+        while pending:
+            tensor = pending.pop()
+            if tensor in boundary or tensor in seen:
+                continue
+            seen.add(tensor)
+            index = producers.get(tensor)
+            if index is None or index in delegated:
+                continue
+            delegated[index] = partition
+            pending.extend(int(t) for t in nodes[index]['inputs'])
+
+    fallback = kernels if kernels != XNNPACK else BUILTIN
+    ops = [{
+        'index': index,
+        'op': op['op_name'],
+        'kernels': XNNPACK if index in delegated else fallback,
+        'partition': delegated.get(index)
+    } for index, op in sorted(nodes.items())]
+    return ops, delegates
+
+
+def arena_tensor_bytes(interpreter):
+    """Bytes of the tensors the interpreter's arena holds, without buffer reuse
+
+    Counts the model inputs and the outputs of every node that is executed
+    (non-delegated operators and DELEGATE nodes); intermediate tensors of a
+    delegate partition live in the delegate's own buffers. The planner shares
+    memory between tensors whose lifetimes do not overlap, so the real arena
+    is smaller; this is the upper bound that changes with shapes and
+    delegation.
+    """
+    details = interpreter._get_ops_details()
+    delegated = {op['index'] for op in op_placement(interpreter)[0] if op['partition'] is not None}
+    tensors = {int(detail['index']) for detail in interpreter.get_input_details()}
+    for op in details:
+        if op['index'] not in delegated:
+            tensors.update(int(tensor) for tensor in op['outputs'])
+    total = 0
+    for detail in interpreter.get_tensor_details():
+        if detail['index'] in tensors:
+            total += int(np.prod(detail['shape'])) * np.dtype(detail['dtype']).itemsize
+    return total
+
+
+def delegate_summary(ops, partitions):
+    """Coverage of the XNNPACK delegate and the operators left outside it"""
+    delegated = sum(1 for op in ops if op['kernels'] == XNNPACK)
+    return {
+        'partitions': len(partitions),
+        'delegated_ops': delegated,
+        'total_ops': len(ops),
+        'coverage': round(delegated / len(ops), 4) if ops else 0.0,
+        'fallback_ops': dict(Tally(op['op'] for op in ops if op['kernels'] != XNNPACK).most_common())
+    }
+
+
+def check_delegation(model, interpreter):
+    """Export and log how much of a loaded model runs on XNNPACK
+
+    Warns when operators fall back to the builtin kernels, e.g. after a model
+    change introduced an operator or data type the delegate does not support.
+    """
+    if not supports_op_details(interpreter):
+        return None
+    ops, partitions = op_placement(interpreter)
+    summary = delegate_summary(ops, partitions)
+    for kernels in (XNNPACK, BUILTIN):
+        MODEL_OPS.labels(model=model, kernels=kernels).set(sum(1 for op in ops if op['kernels'] == kernels))
+    if not partitions:
+        logger.warning(f"Model {model}: XNNPACK delegate not applied, all {len(ops)} operators run on builtin kernels")
+    elif summary['fallback_ops']:
+        fallback = ', '.join(f"{op} x{count}" for op, count in summary['fallback_ops'].items())
+        logger.warning(f"Model {model}: {len(ops) - summary['delegated_ops']} of {len(ops)} operators run outside "
+                       f"XNNPACK ({fallback})")
+    else:
+        logger.info(f"Model {model}: all {len(ops)} operators delegated to XNNPACK "
+                    f"in {len(partitions)} partition(s)")
+    return summary
+
+
+def op_resolver(runtime, kernels):
+    """OpResolverType member selecting a kernel set; raises ValueError when the runtime lacks it
+
+    XNNPACK is the interpreter default and needs none (None is returned).
+    LiteRT and tflite_runtime export the enum next to their Interpreter,
+    TensorFlow as tf.lite.experimental.OpResolverType.
+    """
+    if runtime.name in ('onnx', 'stub'):
+        raise ValueError(f"Operator reports need a TFLite runtime, not {runtime.name}")
+    if kernels not in OP_RESOLVERS:
+        raise ValueError(f"Unknown kernels: {kernels} (expected one of {', '.join(OP_RESOLVERS)})")
+    if kernels == XNNPACK:
+        return None
+    resolver_types = getattr(runtime.module, 'OpResolverType', None) \
+        or getattr(getattr(runtime.module, 'experimental', None), 'OpResolverType', None)
+    resolver = getattr(resolver_types, OP_RESOLVERS[kernels], None)
+    if resolver is None:
+        raise ValueError(f"{runtime.name} {runtime.version} does not support selecting {kernels} kernels")
+    return resolver
+
+
+def create_interpreter(runtime, model_path, num_threads, kernels=XNNPACK):
+    """Create an interpreter of a TFLite runtime with the given kernel set"""
+    resolver = op_resolver(runtime, kernels)
+    if resolver is None:
+        return runtime.module.Interpreter(model_path=model_path, num_threads=num_threads)
+    return runtime.module.Interpreter(
+        model_path=model_path,
+        num_threads=num_threads,
+        experimental_op_resolver_type=resolver
+    )
+
+
+def time_invokes(interpreter, iterations=20, seed=0):
+    """Invoke an allocated interpreter on seeded random inputs; returns the invoke times in seconds"""
+    rng = np.random.default_rng(seed)
+    for detail in interpreter.get_input_details():
+        interpreter.set_tensor(detail['index'], rng.uniform(0, 255, detail['shape']).astype(detail['dtype']))
+    timings = []
+    for _ in range(iterations + 1):
+        start = time.perf_counter()
+        interpreter.invoke()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def model_report(runtime, model_path, thread_counts=(1,), kernel_sets=(XNNPACK, BUILTIN), iterations=20):
+    """Operator placement, arena size and invoke times of a TFLite model
+
+    The operator list comes from an interpreter created the way the service
+    creates them (XNNPACK applied). Then one interpreter per kernel set and
+    thread count is allocated and timed: the first invoke separately (it
+    pays delegate and arena setup), then iterations invokes summarised as
+    median, p95 and mean. The Python API has no per-operator profiler, so
+    comparing kernel sets is how the cost of operators that fall off the
+    delegate shows up. Raises ValueError before any interpreter is timed when
+    the runtime cannot report operators or select one of the kernel sets.
+    """
+    for kernels in kernel_sets:
+        op_resolver(runtime, kernels)
+    interpreter = create_interpreter(runtime, model_path, thread_counts[0])
+    if not supports_op_details(interpreter):
+        raise ValueError(f"{runtime.name} {runtime.version} does not expose operator details")
+    interpreter.allocate_tensors()
+    ops, partitions = op_placement(interpreter)
+    op_counts = {}
+    for op in ops:
+        counts = op_counts.setdefault(op['op'], {})
+        counts[op['kernels']] = counts.get(op['kernels'], 0) + 1
+    inputs = [{'name': detail['name'], 'shape': detail['shape'].tolist(), 'dtype': np.dtype(detail['dtype']).name}
+              for detail in interpreter.get_input_details()]
+    del interpreter
+
+    runs = []
+    for kernels in kernel_sets:
+        for num_threads in thread_counts:
+            interpreter = create_interpreter(runtime, model_path, num_threads, kernels)
+            rss_before = current_rss()
+            start = time.perf_counter()
+            interpreter.allocate_tensors()
+            allocate_seconds = time.perf_counter() - start
+            allocate_rss = current_rss() - rss_before
+            timings = time_invokes(interpreter, iterations)
+            steady = np.array(timings[1:])
+            runs.append({
+                'kernels': kernels,
+                'threads': num_threads,
+                'allocate_seconds': round(allocate_seconds, 6),
+                'allocate_rss_bytes': allocate_rss,
+                'arena_tensor_bytes': arena_tensor_bytes(interpreter),
+                'first_invoke': round(timings[0], 6),
+                'median': round(float(np.median(steady)), 6),
+                'p95': round(float(np.percentile(steady, 95)), 6),
+                'mean': round(float(steady.mean()), 6)
+            })
+            del interpreter
+
+    return {
+        'model': os.path.splitext(os.path.basename(model_path))[0],
+        'path': model_path,
+        'file_bytes': os.path.getsize(model_path),
+        'runtime': {'backend': runtime.name, 'version': runtime.version},
+        'inputs': inputs,
+        'delegate': delegate_summary(ops, partitions),
+        'op_counts': op_counts,
+        'ops': ops,
+        'iterations': iterations,
+        'invokes': runs
+    }
+
+
+def format_report(report, show_ops=False):
+    """Plain-text rendering of model_report() for terminals"""
+    delegate = report['delegate']
+    lines = [
+        f"Model:    {report['path']} ({report['file_bytes'] / 2**20:.2f} MiB)",
+        f"Runtime:  {report['runtime']['backend']} {report['runtime']['version']}",
+        'Inputs:   ' + ', '.join(f"{i['name']} {i['shape']} {i['dtype']}" for i in report['inputs']),
+        f"XNNPACK:  {delegate['delegated_ops']}/{delegate['total_ops']} operators "
+        f"({delegate['coverage']:.1%}) in {delegate['partitions']} partition(s)",
+    ]
+    if delegate['fallback_ops']:
+        lines.append('Fallback: ' + ', '.join(f"{op} x{count}" for op, count in delegate['fallback_ops'].items()))
+
+    lines += ['', f"{'Operator':<28}{'xnnpack':>9}{'builtin':>9}"]
+    for op, counts in sorted(report['op_counts'].items(), key=lambda item: -sum(item[1].values())):
+        lines.append(f"{op:<28}{counts.get(XNNPACK, 0):>9}{counts.get(BUILTIN, 0):>9}")
+
+    lines += ['', f"Invoke times over {report['iterations']} iterations (ms), arena sizes (KiB)",
+              f"{'kernels':<10}{'threads':>8}{'first':>10}{'median':>10}{'p95':>10}{'mean':>10}"
+              f"{'arena':>10}{'alloc rss':>11}"]
+    for run in report['invokes']:
+        lines.append(
+            f"{run['kernels']:<10}{run['threads']:>8}{run['first_invoke'] * 1000:>10.2f}{run['median'] * 1000:>10.2f}"
+            f"{run['p95'] * 1000:>10.2f}{run['mean'] * 1000:>10.2f}{run['arena_tensor_bytes'] / 1024:>10.0f}"
+            f"{run['allocate_rss_bytes'] / 1024:>11.0f}"
+        )
+
+    if show_ops:
+        lines += ['', f"{'#':>5}  {'operator':<28}{'kernels':<10}partition"]
+        for op in report['ops']:
+            partition = '' if op['partition'] is None else op['partition']
+            lines.append(f"{op['index']:>5}  {op['op']:<28}{op['kernels']:<10}{partition}")
+    return '\n'.join(lines)
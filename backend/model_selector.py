@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+MODEL_SWITCHES = Counter('cloudpose_model_switches_total', 'Switches between the full and light model', ['to'])
+ACTIVE_MODEL = Gauge('cloudpose_active_model',
+                     'Model variant currently selected for new requests (workers with the variant active)',
+                     ['model'], multiprocess_mode='livesum')
+MODEL_INFERENCES = Counter('cloudpose_model_inferences_total', 'Inferences run per model variant', ['model'])
+RECENT_P95 = Gauge('cloudpose_inference_latency_p95_seconds',
+                   'Recent p95 of inference latency including queueing, as seen by the model selector',
+                   multiprocess_mode='livemax')
+
+FULL = 'full'
+LIGHT = 'light'
+
+# Load is re-evaluated at most this often (seconds)
+EVALUATE_INTERVAL = 0.25
+
+
+class LoadAwareSelector:
+    """Chooses between the full and a lighter model variant based on load
+
+    Requests are degraded to the light model once the inference queue holds
+    queue_high requests or the recent p95 latency (queue wait included)
+    reaches p95_high seconds. The full model comes back once both have
+    fallen below recover_ratio of their thresholds, and never sooner than
+    min_dwell seconds after the previous switch so the choice does not flap.
+    """
+
+    def __init__(self, queue_high, p95_high, recover_ratio=0.5, min_dwell=5.0, window=10.0):
+        self.queue_high = queue_high
+        self.p95_high = p95_high
+        self.recover_ratio = recover_ratio
+        self.min_dwell = min_dwell
+        self.window = window
+
+        self.current = FULL
+        self._latencies = deque()  # (timestamp, seconds)
+        self._p95 = 0.0
+        self._switched_at = 0.0
+        self._evaluated_at = 0.0
+        self._lock = threading.Lock()
+
+        self.publish_metrics()
+
+    def publish_metrics(self):
+        """Set the active model gauge (again after a fork, where each process reports its own)"""
+        ACTIVE_MODEL.labels(model=FULL).set(1 if self.current == FULL else 0)
+        ACTIVE_MODEL.labels(model=LIGHT).set(1 if self.current == LIGHT else 0)
+
+    def observe(self, latency):
+        """Record the latency of an inference, queue wait included"""
+        with self._lock:
+            self._latencies.append((time.time(), latency))
+
+    def p95(self):
+        return self._p95
+
+    def select(self, queue_depth):
+        """Return the variant new requests should use given the current queue depth"""
+        now = time.time()
+        if now - self._evaluated_at < EVALUATE_INTERVAL:
+            return self.current
+
+        with self._lock:
+            self._evaluated_at = now
+            while self._latencies and self._latencies[0][0] < now - self.window:
+                self._latencies.popleft()
+            if self._latencies:
+                self._p95 = float(np.percentile([latency for _, latency in self._latencies], 95))
+            else:
+                self._p95 = 0.0
+            RECENT_P95.set(self._p95)
+
+            if now - self._switched_at < self.min_dwell:
+                return self.current
+
+            overloaded = queue_depth >= self.queue_high or self._p95 >= self.p95_high
+            recovered = (queue_depth <= self.queue_high * self.recover_ratio
+                         and self._p95 <= self.p95_high * self.recover_ratio)
+            if self.current == FULL and overloaded:
+                self._switch(LIGHT, now, queue_depth)
+            elif self.current == LIGHT and recovered:
+                self._switch(FULL, now, queue_depth)
+            return self.current
+
+    def _switch(self, variant, now, queue_depth):
+        logger.info(f"Switching to {variant} model (queue depth {queue_depth}, p95 {self._p95 * 1000:.1f}ms)")
+        self.current = variant
+        self._switched_at = now
+        MODEL_SWITCHES.labels(to=variant).inc()
+        self.publish_metrics()
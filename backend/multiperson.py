@@ -0,0 +1,122 @@
+import math
+
+import numpy as np
+
+from postprocess import CONFIDENCE_THRESHOLD, NUM_KEYPOINTS, keypoint_boxes
+
+# Minimum overlap between neighbouring tiles, as a fraction of the tile size
+TILE_OVERLAP = 0.25
+
+# Tile sizes, as a fraction of the frame's short side, for each zoom level
+TILE_SCALES = (1.0, 0.75, 0.5)
+
+# Crop detections need this many visible keypoints to count as a person
+MIN_VISIBLE_KEYPOINTS = 5
+
+# Boxes overlapping a better one by more than this IoU are suppressed
+NMS_IOU_THRESHOLD = 0.5
+
+# Boxes lying mostly inside a better one (partial views of the same person)
+NMS_CONTAINMENT_THRESHOLD = 0.8
+
+
+def _tile_positions(length, size):
+    """Start offsets of tiles of the given size covering [0, length)"""
+    if size >= length:
+        return [0]
+    count = math.ceil((length - size) / (size * (1 - TILE_OVERLAP))) + 1
+    return [int(round(p)) for p in np.linspace(0, length - size, count)]
+
+
+def plan_crops(height, width, max_crops):
+    """Crop windows for the multi-person cascade
+
+    Returns up to max_crops (x, y, width, height) windows: the whole frame
+    first, then square tiles at increasing zoom levels so smaller people
+    fill more of the model input.
+    """
+    crops = [(0, 0, width, height)]
+    short_side = min(height, width)
+    for scale in TILE_SCALES:
+        size = max(1, int(round(short_side * scale)))
+        for y in _tile_positions(height, size):
+            for x in _tile_positions(width, size):
+                if len(crops) >= max_crops:
+                    return crops
+                crop = (x, y, min(size, width - x), min(size, height - y))
+                if crop not in crops:
+                    crops.append(crop)
+    return crops
+
+
+def crops_to_frame(keypoints, crops, height, width):
+    """Map (N, 17, 3) keypoints normalised to each crop back to the full frame"""
+    keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, NUM_KEYPOINTS, 3).copy()
+    crops = np.asarray(crops, dtype=np.float32).reshape(-1, 4)
+    keypoints[..., 0] = (crops[:, 1:2] + keypoints[..., 0] * crops[:, 3:4]) / height
+    keypoints[..., 1] = (crops[:, 0:1] + keypoints[..., 1] * crops[:, 2:3]) / width
+    return keypoints
+
+
+def non_max_suppression(boxes, scores):
+    """Indices of boxes kept by greedy NMS, best score first
+
+    A box is dropped when its IoU with a kept box exceeds NMS_IOU_THRESHOLD,
+    or when most of it lies inside a kept box (a partial view of the same
+    person seen by a smaller tile).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    areas = np.maximum(0, boxes[:, 2] - boxes[:, 0]) * np.maximum(0, boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-np.asarray(scores), kind='stable')
+
+    keep = []
+    while len(order):
+        best = order[0]
+        keep.append(int(best))
+        rest = order[1:]
+
+        inter_w = np.maximum(0, np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]))
+        inter_h = np.maximum(0, np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]))
+        inter = inter_w * inter_h
+        union = areas[best] + areas[rest] - inter
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        containment = np.divide(inter, areas[rest], out=np.zeros_like(inter), where=areas[rest] > 0)
+
+        order = rest[(iou <= NMS_IOU_THRESHOLD) & (containment <= NMS_CONTAINMENT_THRESHOLD)]
+    return keep
+
+
+def merge_crop_detections(keypoints, crops, frame_shape, box_shape=None, threshold=CONFIDENCE_THRESHOLD):
+    """Turn per-crop MoveNet outputs into a deduplicated person list
+
+    keypoints holds one (17, 3) output per crop; crops are windows in a frame
+    of frame_shape (height, width). Boxes are reported in box_shape (the
+    original image size, defaults to frame_shape). Returns the persons (same
+    layout as postprocess.persons_from_keypoints, with keypoints normalised
+    to the full frame) and, for each crop, the index of the person it
+    produced or None.
+    """
+    frame_keypoints = crops_to_frame(keypoints, crops, *frame_shape)
+    count = len(frame_keypoints)
+    boxes, probabilities, valid = keypoint_boxes(frame_keypoints, [box_shape or frame_shape] * count, threshold)
+    visible_count = (frame_keypoints[..., 2] > threshold).sum(axis=1)
+
+    candidates = np.flatnonzero(valid & (visible_count >= MIN_VISIBLE_KEYPOINTS))
+    kept = [int(candidates[i]) for i in non_max_suppression(boxes[candidates], probabilities[candidates])]
+
+    persons = []
+    crop_person = [None] * count
+    for crop_index in kept:
+        x_min, y_min, x_max, y_max = boxes[crop_index].tolist()
+        crop_person[crop_index] = len(persons)
+        persons.append({
+            "box": {
+                "x": int(x_min),
+                "y": int(y_min),
+                "width": int(x_max - x_min),
+                "height": int(y_max - y_min),
+                "probability": float(probabilities[crop_index])
+            },
+            "keypoints": frame_keypoints[crop_index].copy()
+        })
+    return persons, crop_person
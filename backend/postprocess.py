@@ -0,0 +1,92 @@
+import numpy as np
+
+# Keypoints at or below this confidence are ignored when building boxes
+CONFIDENCE_THRESHOLD = 0.3
+
+# Pixels added around the visible keypoints of each box
+BOX_MARGIN = 20
+
+NUM_KEYPOINTS = 17
+
+
+def keypoint_boxes(keypoints, shapes, threshold=CONFIDENCE_THRESHOLD, margin=BOX_MARGIN):
+    """Compute person boxes for a batch of MoveNet outputs
+
+    keypoints is a (B, 17, 3) array of [y, x, confidence] rows normalised to
+    [0, 1]; shapes is a (B, 2) sequence of (height, width) the boxes are
+    reported in. Returns (boxes, probabilities, valid): boxes is a (B, 4)
+    array of [x_min, y_min, x_max, y_max] clamped to the image after adding
+    the margin, probabilities the mean confidence of the visible keypoints,
+    and valid marks the images with at least one visible keypoint.
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, NUM_KEYPOINTS, 3)
+    shapes = np.asarray(shapes, dtype=np.float64).reshape(-1, 2)
+    heights = shapes[:, 0:1]
+    widths = shapes[:, 1:2]
+
+    # Compare in float64 like the original loop: float32(0.3) is above 0.3
+    confidence = keypoints[..., 2]
+    visible = confidence.astype(np.float64) > threshold
+    valid = visible.any(axis=1)
+
+    # Pixel coordinates of every keypoint (in float64 so boxes round like the
+    # original per-keypoint loop), with hidden ones masked out of min/max
+    xs = keypoints[..., 1].astype(np.float64) * widths
+    ys = keypoints[..., 0].astype(np.float64) * heights
+    x_min = np.where(visible, xs, np.inf).min(axis=1)
+    y_min = np.where(visible, ys, np.inf).min(axis=1)
+    x_max = np.where(visible, xs, -np.inf).max(axis=1)
+    y_max = np.where(visible, ys, -np.inf).max(axis=1)
+
+    # Add margin and clamp to the image
+    boxes = np.stack([
+        np.maximum(0, x_min - margin),
+        np.maximum(0, y_min - margin),
+        np.minimum(widths[:, 0], x_max + margin),
+        np.minimum(heights[:, 0], y_max + margin)
+    ], axis=1)
+    boxes[~valid] = 0
+
+    visible_count = visible.sum(axis=1)
+    probabilities = np.divide((confidence * visible).sum(axis=1, dtype=np.float64), visible_count,
+                              out=np.zeros(len(keypoints), dtype=np.float64),
+                              where=visible_count > 0)
+
+    return boxes, probabilities, valid
+
+
+def persons_from_keypoints(keypoints, shapes, threshold=CONFIDENCE_THRESHOLD, margin=BOX_MARGIN):
+    """Build the person list of every image in a batch of MoveNet outputs
+
+    Returns one list per image holding at most one person dict with a JSON
+    ready "box" and the (17, 3) "keypoints" array, which stays a NumPy array
+    until serialize_persons() is called.
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, NUM_KEYPOINTS, 3)
+    boxes, probabilities, valid = keypoint_boxes(keypoints, shapes, threshold, margin)
+
+    results = []
+    for i in range(len(keypoints)):
+        if not valid[i]:
+            results.append([])
+            continue
+        x_min, y_min, x_max, y_max = boxes[i].tolist()
+        results.append([{
+            "box": {
+                "x": int(x_min),
+                "y": int(y_min),
+                "width": int(x_max - x_min),
+                "height": int(y_max - y_min),
+                "probability": float(probabilities[i])
+            },
+            # Copy so the person does not keep the whole batch output alive
+            "keypoints": keypoints[i].copy()
+        }])
+    return results
+
+
+def serialize_persons(persons):
+    """Convert a person list to JSON-ready (boxes, keypoints) lists"""
+    boxes = [person['box'] for person in persons]
+    keypoints = [np.asarray(person['keypoints']).tolist() for person in persons]
+    return boxes, keypoints
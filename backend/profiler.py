@@ -0,0 +1,236 @@
+import cProfile
+import io
+import linecache
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter as Tally
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+
+# Where time goes, matched against the file/function of a cProfile entry or
+# the file and source line of the innermost sampled frame
+LIBRARIES = (
+    ('inference', re.compile(r'litert|tflite|tensorflow|onnxruntime|\b[Ii]nvoke\b')),
+    ('cv2', re.compile(r'cv2')),
+    ('PIL', re.compile(r'PIL|Imaging|Image\.')),
+    ('json', re.compile(r'json')),
+    ('base64', re.compile(r'base64|binascii|b64')),
+    ('numpy', re.compile(r'numpy|np\.')),
+    ('flask', re.compile(r'flask|werkzeug|jsonify')),
+)
+
+# Innermost frames of threads that are only waiting for work
+IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py', 'socket.py', 'socketserver.py', 'thread.py')
+
+
+def classify(text):
+    for library, pattern in LIBRARIES:
+        if pattern.search(text):
+            return library
+    return 'python'
+
+
+class ProfilingSession:
+    """Profiles the next max_requests requests or a time window
+
+    In cprofile mode every request counted by begin_request()/end_request()
+    runs under its own deterministic profiler (request threads only; work
+    done on decode or batching threads is not seen), and the stats are merged.
+    In sample mode a background thread records the stacks of all threads
+    every interval seconds, which also covers those threads and produces
+    flamegraph-compatible collapsed stacks. functions names the hot path
+    functions to report individually.
+    """
+
+    def __init__(self, mode=SAMPLE, max_requests=None, duration=None, interval=0.005, functions=(),
+                 include_idle=False):
+        if mode not in (CPROFILE, SAMPLE):
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.mode = mode
+        self.max_requests = max_requests
+        self.duration = duration
+        self.interval = interval
+        self.functions = tuple(functions)
+        self.include_idle = include_idle
+
+        self.requests = 0
+        self.skipped = 0
+        self.samples = 0
+        self._stats = None
+        self._stacks = Tally()
+        self._leaves = Tally()  # (filename, line, function) of the innermost frame
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._sampler = None
+        self._started_at = None
+        self._elapsed = None
+
+    def start(self):
+        self._started_at = time.time()
+        if self.mode == SAMPLE:
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+            self._sampler.start()
+
+    def wait(self, timeout):
+        """Block until the requests were profiled or the window (or timeout) elapsed"""
+        window = self.duration if self.duration is not None else timeout
+        self._done.wait(min(window, timeout))
+        self.stop()
+
+    def stop(self):
+        if self._elapsed is None:
+            self._elapsed = time.time() - self._started_at
+        self._done.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    @property
+    def elapsed(self):
+        if self._elapsed is not None:
+            return self._elapsed
+        return time.time() - self._started_at if self._started_at else 0.0
+
+    def begin_request(self):
+        """Called when a profiled request starts; returns a token for end_request()"""
+        if self.finished or self.mode != CPROFILE:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Only one deterministic profiler may be active at a time on
+            # Python 3.12+, so concurrent requests are not all profiled
+            with self._lock:
+                self.skipped += 1
+            return None
+        return profile
+
+    def end_request(self, token):
+        if token is not None:
+            token.disable()
+        with self._lock:
+            if self.finished:
+                return
+            if token is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(token)
+                else:
+                    self._stats.add(token)
+            self.requests += 1
+            if self.max_requests is not None and self.requests >= self.max_requests:
+                self._elapsed = time.time() - self._started_at
+                self._done.set()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._done.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = self._collapse(frame, names.get(thread_id, str(thread_id)))
+                if stack is not None:
+                    self._stacks[stack] += 1
+            self.samples += 1
+
+    def _collapse(self, frame, thread_name):
+        leaf = frame.f_code.co_filename
+        if not self.include_idle and os.path.basename(leaf) in IDLE_FILES:
+            return None
+        self._leaves[(leaf, frame.f_lineno, frame.f_code.co_name)] += 1
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ';'.join(reversed(frames))
+
+    def collapsed(self):
+        """Sampled stacks in collapsed format ("frame;frame;frame count" per line)"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def pstats_text(self, top=30):
+        if self._stats is None:
+            return 'No requests profiled\n'
+        stream = io.StringIO()
+        self._stats.stream = stream
+        self._stats.sort_stats('cumulative').print_stats(top)
+        return stream.getvalue()
+
+    def _cprofile_summary(self, top):
+        functions = {}
+        libraries = Tally()
+        entries = []
+        if self._stats is not None:
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in self._stats.stats.items():
+                libraries[classify(f"{filename}:{name}")] += tottime
+                entries.append((cumtime, f"{name} ({os.path.basename(filename)}:{line})", calls, tottime))
+                if name in self.functions and not filename.startswith('~'):
+                    function = functions.setdefault(name, {'calls': 0, 'tottime': 0.0, 'cumtime': 0.0})
+                    function['calls'] += calls
+                    function['tottime'] += tottime
+                    function['cumtime'] += cumtime
+        entries.sort(reverse=True)
+        return {
+            'functions': {name: {key: round(value, 6) for key, value in stats.items()}
+                          for name, stats in functions.items()},
+            'libraries': {library: round(seconds, 6) for library, seconds in libraries.most_common()},
+            'top': [{'function': function, 'calls': calls, 'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6)}
+                    for cumtime, function, calls, tottime in entries[:top]]
+        }
+
+    def _sample_summary(self, top):
+        functions = Tally()
+        for stack, count in self._stacks.items():
+            names = {frame.split(' ', 1)[0] for frame in stack.split(';')[1:]}
+            for name in self.functions:
+                if name in names:
+                    functions[name] += count
+
+        libraries = Tally()
+        for (filename, line, name), count in self._leaves.items():
+            # The innermost Python frame is the caller of any C extension
+            # (cv2, PIL's decoder, the interpreter), so its source line tells
+            libraries[classify(f"{filename}:{name}:{linecache.getline(filename, line).strip()}")] += count
+
+        # Sample counts times the interval approximate wall time, summed over threads
+        scale = self.interval
+        return {
+            'functions': {name: {'samples': count, 'seconds': round(count * scale, 6)}
+                          for name, count in functions.most_common()},
+            'libraries': {library: {'samples': count, 'seconds': round(count * scale, 6)}
+                          for library, count in libraries.most_common()},
+            'top': [{'frame': f"{name} ({os.path.basename(filename)}:{line})", 'samples': count}
+                    for (filename, line, name), count in self._leaves.most_common(top)]
+        }
+
+    def summary(self, top=30):
+        """JSON-serializable result of the session"""
+        result = {
+            'mode': self.mode,
+            'elapsed': round(self.elapsed, 6),
+            'requests': self.requests
+        }
+        if self.mode == CPROFILE:
+            result['skipped_requests'] = self.skipped
+            result.update(self._cprofile_summary(top))
+        else:
+            result['samples'] = self.samples
+            result['interval'] = self.interval
+            result.update(self._sample_summary(top))
+        return result
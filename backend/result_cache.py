@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+CACHE_HITS = Counter('cloudpose_result_cache_hits_total', 'Pose result cache hits', ['lookup'])
+CACHE_MISSES = Counter('cloudpose_result_cache_misses_total', 'Pose result cache misses', ['lookup'])
+CACHE_EVICTIONS = Counter('cloudpose_result_cache_evictions_total', 'Pose result cache evictions', ['reason'])
+CACHE_BYTES = Gauge('cloudpose_result_cache_bytes', 'Estimated memory held by cached pose results',
+                    multiprocess_mode='livesum')
+CACHE_ENTRIES = Gauge('cloudpose_result_cache_entries', 'Number of cached pose results', multiprocess_mode='livesum')
+
+# Accounting cost of an alias entry (the payload hash pointing at a content hash)
+ALIAS_SIZE = 128
+
+
+def content_key(data):
+    """Hash bytes into a cache key"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def estimate_size(value):
+    """Rough estimate of the memory held by a cached result"""
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (0 if value.flags.owndata else value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class PoseResultCache:
+    """Content-addressed LRU cache of detect_persons() results
+
+    Entries are evicted least-recently-used first once their estimated size
+    exceeds max_bytes, and lazily on lookup once they are older than ttl
+    seconds (if set). Alias keys let a cheap hash of the raw request payload
+    resolve to the entry stored under the decoded image's hash.
+    """
+
+    def __init__(self, max_bytes, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._aliases = {}             # alias -> key
+        self._aliases_by_key = {}      # key -> set of aliases
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, lookup='content'):
+        """Return the cached value for key (or an alias of it), or None"""
+        return self.get_any((key,), lookup)[1]
+
+    def get_any(self, keys, lookup='content'):
+        """Return (key, value) for the first of keys that is cached, or (None, None)
+
+        Counts as a single lookup, a hit if any of the keys is cached.
+        """
+        with self._lock:
+            for key in keys:
+                primary = self._aliases.get(key, key)
+                entry = self._entries.get(primary)
+                if entry is not None and entry[2] is not None and entry[2] < time.time():
+                    self._remove(primary)
+                    CACHE_EVICTIONS.labels(reason='ttl').inc()
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(primary)
+                    CACHE_HITS.labels(lookup=lookup).inc()
+                    return key, entry[0]
+
+            CACHE_MISSES.labels(lookup=lookup).inc()
+            return None, None
+
+    def put(self, key, value, aliases=()):
+        """Store value under key, reachable through any of the alias keys"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+
+            for alias in aliases:
+                if alias == key or alias in self._aliases:
+                    continue
+                self._aliases[alias] = key
+                self._aliases_by_key.setdefault(key, set()).add(alias)
+                self._bytes += ALIAS_SIZE
+
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                CACHE_EVICTIONS.labels(reason='size').inc()
+
+            self._update_gauges()
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        for alias in self._aliases_by_key.pop(key, ()):
+            del self._aliases[alias]
+            self._bytes -= ALIAS_SIZE
+        self._update_gauges()
+
+    def _update_gauges(self):
+        CACHE_BYTES.set(self._bytes)
+        CACHE_ENTRIES.set(len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
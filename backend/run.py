@@ -6,12 +6,12 @@ Usage:
     python run.py
     
 Or use gunicorn for production deployment:
-    gunicorn -w 4 -b 0.0.0.0:8000 app:app
+    gunicorn -c gunicorn.conf.py wsgi:app
 """
 
 import os
 import sys
-from app import app, load_model, logger
+from app import app, load_model, warm_up_model, start_worker_threads, logger
 
 def main():
     """Main function"""
@@ -19,16 +19,15 @@ def main():
     logger.info("CloudPose Pose Detection Service Starting...")
     logger.info("="*50)
     
-    # Check if model file exists
-    model_path = '../model2-movenet/movenet-full-256.tflite'
-    if not os.path.exists(model_path):
-        logger.error(f"Model file not found: {model_path}")
-        logger.error("Please ensure the model file exists in the correct location")
-        sys.exit(1)
+    # Use the model in the repository unless MODEL_PATH is set; load_model()
+    # checks that the file exists (the stub backend needs none)
+    os.environ.setdefault('MODEL_PATH', '../model2-movenet/movenet-full-256.tflite')
     
     # Load model
-    logger.info("Loading MoveNet model...")
+    logger.info(f"Loading MoveNet model {os.environ['MODEL_PATH']}...")
     if load_model():
+        warm_up_model()
+        start_worker_threads()
         logger.info("✅ Model loaded successfully")
     else:
         logger.error("❌ Model loading failed")
@@ -0,0 +1,291 @@
+import hashlib
+import importlib
+import logging
+import math
+import os
+import re
+import time
+
+import numpy as np
+import psutil
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+RUNTIME_INFO = Gauge('cloudpose_runtime_info', 'Inference runtime backend in use', ['backend', 'version'],
+                     multiprocess_mode='max')
+STARTUP_SECONDS = Gauge('cloudpose_startup_seconds', 'Time spent in each startup phase', ['phase'],
+                        multiprocess_mode='max')
+STARTUP_RSS = Gauge('cloudpose_startup_rss_bytes', 'Resident memory added by each startup phase', ['phase'],
+                    multiprocess_mode='max')
+WARM_UP_INVOKE = Gauge('cloudpose_warm_up_invoke_seconds',
+                       'Invoke time during warm-up per model and batch size (first invoke vs. last iteration)',
+                       ['model', 'batch_size', 'invoke'], multiprocess_mode='max')
+
+# Backends tried in order by INFERENCE_BACKEND=auto: the standalone runtimes
+# first, full TensorFlow only as a fallback
+AUTO_BACKENDS = ('litert', 'tflite_runtime', 'tensorflow')
+
+# Seconds spent in each startup phase of this process, in the order recorded
+_startup_phases = {}
+
+# Stub backend (INFERENCE_BACKEND=stub): mean invoke time for one image, its
+# distribution (constant, uniform, exponential or lognormal) and coefficient of
+# variation, the extra cost of each further image in a batch (as a fraction of
+# one image), and the part of the invoke time spent burning CPU instead of sleeping
+STUB_SERVICE_TIME_MS = float(os.environ.get('STUB_SERVICE_TIME_MS', '20'))
+STUB_SERVICE_TIME_DISTRIBUTION = os.environ.get('STUB_SERVICE_TIME_DISTRIBUTION', 'lognormal').lower()
+STUB_SERVICE_TIME_CV = float(os.environ.get('STUB_SERVICE_TIME_CV', '0.25'))
+STUB_BATCH_ITEM_COST = float(os.environ.get('STUB_BATCH_ITEM_COST', '0.35'))
+STUB_CPU_FRACTION = float(os.environ.get('STUB_CPU_FRACTION', '1.0'))
+STUB_INPUT_SIZE = int(os.environ.get('STUB_INPUT_SIZE', '256'))
+STUB_SEED = int(os.environ.get('STUB_SEED', '0'))
+
+STUB_DISTRIBUTIONS = ('constant', 'uniform', 'exponential', 'lognormal')
+
+# A person standing in the middle of the frame, (y, x) in MoveNet keypoint order
+STUB_SKELETON = np.array([
+    (0.20, 0.50), (0.18, 0.52), (0.18, 0.48), (0.19, 0.55), (0.19, 0.45),
+    (0.30, 0.60), (0.30, 0.40), (0.42, 0.64), (0.42, 0.36), (0.53, 0.66), (0.53, 0.34),
+    (0.55, 0.57), (0.55, 0.43), (0.72, 0.58), (0.72, 0.42), (0.88, 0.58), (0.88, 0.42)
+], dtype=np.float32)
+
+# Buffer hashed to burn CPU; hashlib releases the GIL for it, like a real invoke
+_BURN_BLOCK = bytes(64 * 1024)
+
+
+def current_rss():
+    return psutil.Process().memory_info().rss
+
+
+def record_startup_phase(phase, seconds, rss_bytes=None):
+    """Export the duration (and memory growth) of a startup phase"""
+    _startup_phases[phase] = seconds
+    STARTUP_SECONDS.labels(phase=phase).set(seconds)
+    if rss_bytes is not None:
+        STARTUP_RSS.labels(phase=phase).set(rss_bytes)
+
+
+def startup_phases():
+    """Seconds per startup phase recorded so far (runtime_import, model_load, allocate, warm_up)"""
+    return {phase: round(seconds, 6) for phase, seconds in _startup_phases.items()}
+
+
+def record_warm_up(model, batch_size, first_seconds, last_seconds):
+    """Export the first and the steady-state invoke time seen while warming up a batch size"""
+    WARM_UP_INVOKE.labels(model=model, batch_size=str(batch_size), invoke='first').set(first_seconds)
+    WARM_UP_INVOKE.labels(model=model, batch_size=str(batch_size), invoke='last').set(last_seconds)
+
+
+class OnnxInterpreter:
+    """ONNX Runtime session behind the subset of the TFLite Interpreter API the pool uses
+
+    Tensor indices follow TFLite's layout: inputs first, then outputs.
+    Dynamic dimensions report as 1 until resize_tensor_input() sets them.
+    """
+
+    DTYPES = {
+        'tensor(float)': np.float32,
+        'tensor(int32)': np.int32,
+        'tensor(uint8)': np.uint8,
+        'tensor(int64)': np.int64,
+    }
+
+    def __init__(self, ort, model_path, num_threads=None):
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self._inputs = self._session.get_inputs()
+        self._outputs = self._session.get_outputs()
+        self._input_shapes = [self._static_shape(i.shape) for i in self._inputs]
+        self._feed = {}
+        self._results = []
+
+    @staticmethod
+    def _static_shape(shape):
+        return np.array([d if isinstance(d, int) and d > 0 else 1 for d in shape], dtype=np.int32)
+
+    def _details(self, index, node, shape):
+        return {'index': index, 'name': node.name, 'shape': shape, 'dtype': self.DTYPES.get(node.type, np.float32)}
+
+    def get_input_details(self):
+        return [self._details(i, node, self._input_shapes[i].copy()) for i, node in enumerate(self._inputs)]
+
+    def get_output_details(self):
+        offset = len(self._inputs)
+        return [self._details(offset + i, node, self._static_shape(node.shape)) for i, node in enumerate(self._outputs)]
+
+    def resize_tensor_input(self, index, shape, strict=False):
+        self._input_shapes[index] = np.array(shape, dtype=np.int32)
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        node = self._inputs[index]
+        self._feed[node.name] = np.asarray(value, dtype=self.DTYPES.get(node.type, np.float32))
+
+    def invoke(self):
+        self._results = self._session.run(None, self._feed)
+
+    def get_tensor(self, index):
+        return self._results[index - len(self._inputs)]
+
+
+class StubInterpreter:
+    """Model-free interpreter with the TFLite Interpreter API subset the pool uses
+
+    Returns plausible MoveNet output, (batch, 1, 17, 3) keypoints of a
+    standing person whose position, scale and confidences are derived from
+    the input, so the same image always gives the same result. Each invoke
+    takes a service time drawn from the configured distribution (growing by
+    STUB_BATCH_ITEM_COST per extra image in the batch), of which
+    STUB_CPU_FRACTION is spent burning CPU and the rest sleeping. The input
+    size comes from a trailing number in the model file name
+    (movenet-lightning-192) or STUB_INPUT_SIZE, and the service time scales
+    with the input area relative to 256x256, so a light model is faster.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        if STUB_SERVICE_TIME_DISTRIBUTION not in STUB_DISTRIBUTIONS:
+            raise ValueError(f"Unknown STUB_SERVICE_TIME_DISTRIBUTION: {STUB_SERVICE_TIME_DISTRIBUTION} "
+                             f"(expected one of {', '.join(STUB_DISTRIBUTIONS)})")
+        match = re.search(r'(\d+)$', os.path.splitext(os.path.basename(model_path))[0])
+        size = int(match.group(1)) if match else STUB_INPUT_SIZE
+        self.service_time = STUB_SERVICE_TIME_MS / 1000.0 * (size / 256.0) ** 2
+        self._input_shape = np.array([1, size, size, 3], dtype=np.int32)
+        self._rng = np.random.default_rng(STUB_SEED)
+        self._input = None
+        self._output = np.zeros((1, 1, 17, 3), dtype=np.float32)
+
+    def get_input_details(self):
+        return [{'index': 0, 'name': 'input', 'shape': self._input_shape.copy(), 'dtype': np.float32}]
+
+    def get_output_details(self):
+        shape = np.array([self._input_shape[0], 1, 17, 3], dtype=np.int32)
+        return [{'index': 1, 'name': 'keypoints', 'shape': shape, 'dtype': np.float32}]
+
+    def resize_tensor_input(self, index, shape, strict=False):
+        self._input_shape = np.array(shape, dtype=np.int32)
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        self._input = np.asarray(value, dtype=np.float32)
+
+    def get_tensor(self, index):
+        return self._output
+
+    def _draw_service_time(self, batch_size):
+        mean = self.service_time * (1 + STUB_BATCH_ITEM_COST * (batch_size - 1))
+        cv = STUB_SERVICE_TIME_CV
+        if STUB_SERVICE_TIME_DISTRIBUTION == 'uniform':
+            half_width = min(mean, mean * cv * math.sqrt(3))
+            return self._rng.uniform(mean - half_width, mean + half_width)
+        if STUB_SERVICE_TIME_DISTRIBUTION == 'exponential':
+            return self._rng.exponential(mean)
+        if STUB_SERVICE_TIME_DISTRIBUTION == 'lognormal' and cv > 0:
+            sigma = math.sqrt(math.log(1 + cv * cv))
+            return self._rng.lognormal(math.log(mean) - sigma * sigma / 2, sigma)
+        return mean
+
+    def _keypoints(self, image):
+        # Seeded from a sparse sample of the pixels: cheap and stable per image
+        seed = int(abs(float(image[::16, ::16].sum())) * 1000) % 2**32
+        rng = np.random.default_rng(seed)
+        scale = rng.uniform(0.7, 1.1)
+        center = rng.uniform(0.4, 0.6, 2)
+        points = (STUB_SKELETON - 0.5) * scale + center + rng.normal(0, 0.01, (17, 2))
+        scores = rng.uniform(0.5, 0.95, 17)
+        return np.column_stack([np.clip(points, 0.0, 1.0), scores]).astype(np.float32)
+
+    def invoke(self):
+        start = time.time()
+        batch = self._input if self._input is not None else np.zeros(self._input_shape, dtype=np.float32)
+        self._output = np.stack([self._keypoints(image) for image in batch])[:, np.newaxis]
+
+        service_time = self._draw_service_time(len(batch))
+        burn_until = start + service_time * STUB_CPU_FRACTION
+        while time.time() < burn_until:
+            hashlib.sha256(_BURN_BLOCK)
+        remaining = start + service_time - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+class Runtime:
+    """An importable inference backend and the interpreters it creates"""
+
+    def __init__(self, name, module, version, import_seconds, import_rss):
+        self.name = name
+        self.module = module
+        self.version = version
+        self.import_seconds = import_seconds
+        self.import_rss = import_rss
+
+    def create_interpreter(self, model_path, num_threads=None):
+        if self.name == 'onnx':
+            return OnnxInterpreter(self.module, model_path, num_threads)
+        if self.name == 'stub':
+            return StubInterpreter(model_path, num_threads)
+        return self.module.Interpreter(model_path=model_path, num_threads=num_threads)
+
+    def info(self):
+        return {
+            'backend': self.name,
+            'version': self.version,
+            'import_seconds': round(self.import_seconds, 6),
+            'import_rss_bytes': self.import_rss
+        }
+
+
+def _import_backend(name):
+    """Import a backend's module, returns (module with an Interpreter or ort API, version)"""
+    if name == 'litert':
+        module = importlib.import_module('ai_edge_litert.interpreter')
+        version = getattr(importlib.import_module('ai_edge_litert'), '__version__', None)
+    elif name == 'tflite_runtime':
+        module = importlib.import_module('tflite_runtime.interpreter')
+        version = getattr(importlib.import_module('tflite_runtime'), '__version__', None)
+    elif name == 'tensorflow':
+        module = importlib.import_module('tensorflow.lite')
+        version = getattr(importlib.import_module('tensorflow'), '__version__', None)
+    elif name == 'onnx':
+        module = importlib.import_module('onnxruntime')
+        version = getattr(module, '__version__', None)
+    elif name == 'stub':
+        # Built in, see StubInterpreter
+        module, version = None, 'stub'
+    else:
+        raise ValueError(f"Unknown inference backend: {name}")
+    return module, version
+
+
+def load_runtime(backend='auto'):
+    """Import the requested inference backend (or the first available one for 'auto')
+
+    Records how long the import took and how much resident memory it added.
+    Raises ImportError when no requested backend can be imported.
+    """
+    candidates = AUTO_BACKENDS if backend == 'auto' else (backend,)
+    errors = []
+    for name in candidates:
+        rss_before = current_rss()
+        start_time = time.time()
+        try:
+            module, version = _import_backend(name)
+        except ImportError as e:
+            errors.append(f"{name}: {e}")
+            continue
+        runtime = Runtime(name, module, version or 'unknown', time.time() - start_time,
+                          current_rss() - rss_before)
+        RUNTIME_INFO.labels(backend=name, version=runtime.version).set(1)
+        record_startup_phase('runtime_import', runtime.import_seconds, runtime.import_rss)
+        logger.info(f"Inference backend {name} {runtime.version} imported in {runtime.import_seconds:.3f}s "
+                    f"(+{runtime.import_rss / 2**20:.1f}MiB RSS)")
+        return runtime
+    raise ImportError(f"No inference backend available ({'; '.join(errors)})")
@@ -0,0 +1,81 @@
+import logging
+import threading
+
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+# Prometheus monitoring metrics
+COALESCED_COUNT = Counter(
+    'cloudpose_inference_coalesced_total',
+    'Inferences saved by sharing the result of an identical in-flight request'
+)
+
+
+class SingleFlightTimeout(Exception):
+    """Raised to a waiting caller when the shared execution did not finish in time"""
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for it and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def running(self, key):
+        """Whether a call for key is running, i.e. do(key) would currently wait for it"""
+        return key in self._calls
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() once per key among concurrent callers
+
+        Returns (result, shared) where shared is True for callers that
+        reused another caller's execution. Waiting callers give up after
+        timeout seconds (None waits for as long as the first caller runs)
+        with SingleFlightTimeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise SingleFlightTimeout(f"Shared execution still running after {timeout:.3f}s")
+            if call.error is not None:
+                raise call.error
+            COALESCED_COUNT.inc()
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @property
+    def in_flight(self):
+        return len(self._calls)
@@ -71,6 +71,78 @@ def test_pose_detection():
         print(f"Pose detection test failed: {e}")
         return False
 
+def test_binary_upload():
+    """Test raw image upload and raw JPEG download"""
+    print("\nTesting binary upload endpoint...")
+    
+    image_path = '../model2-movenet/test.jpg'
+    if not os.path.exists(image_path):
+        print(f"Test image not found: {image_path}")
+        return False
+    
+    try:
+        with open(image_path, 'rb') as f:
+            img_bytes = f.read()
+        
+        response = requests.post(
+            'http://127.0.0.1:8000/api/pose_estimation_image',
+            data=img_bytes,
+            headers={
+                'Content-Type': 'image/jpeg',
+                'Accept': 'image/jpeg',
+                'X-Request-ID': 'test_binary_001'
+            }
+        )
+        
+        print(f"Status Code: {response.status_code}")
+        print(f"Content-Type: {response.headers.get('Content-Type')}")
+        print(f"Annotated image size: {len(response.content)} bytes")
+        print(f"Inference time: {response.headers.get('X-Speed-Inference')}")
+        
+        return response.status_code == 200 and response.headers.get('Content-Type') == 'image/jpeg'
+        
+    except Exception as e:
+        print(f"Binary upload test failed: {e}")
+        return False
+
+def test_batch_detection():
+    """Test batch pose detection endpoint"""
+    print("\nTesting batch pose detection endpoint...")
+    
+    image_path = '../model2-movenet/test.jpg'
+    if not os.path.exists(image_path):
+        print(f"Test image not found: {image_path}")
+        return False
+    
+    try:
+        with open(image_path, 'rb') as f:
+            img_data = base64.b64encode(f.read()).decode()
+        
+        payload = {
+            'images': [{'id': f'test_batch_{i:03d}', 'image': img_data} for i in range(4)]
+        }
+        
+        response = requests.post(
+            'http://127.0.0.1:8000/api/pose_detection_batch',
+            json=payload,
+            headers={'Content-Type': 'application/json'}
+        )
+        
+        print(f"Status Code: {response.status_code}")
+        result = response.json()
+        
+        if response.status_code == 200:
+            print(f"Success! Processed {result.get('count')} images")
+            print(f"Inference time: {result.get('speed_inference')}")
+        else:
+            print(f"Error: {json.dumps(result, indent=2)}")
+        
+        return response.status_code == 200 and result.get('count') == 4
+        
+    except Exception as e:
+        print(f"Batch detection test failed: {e}")
+        return False
+
 def test_invalid_request():
     """Test invalid request handling"""
     print("\nTesting invalid request handling...")
@@ -101,6 +173,8 @@ if __name__ == '__main__':
     tests = [
         ("Health Check", test_health_check),
         ("Pose Detection", test_pose_detection),
+        ("Binary Upload", test_binary_upload),
+        ("Batch Detection", test_batch_detection),
         ("Invalid Request", test_invalid_request)
     ]
     
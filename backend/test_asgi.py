@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Checks load shedding in the ASGI entry point, on the stub inference backend
+
+Run with: python -m pytest test_asgi.py
+"""
+
+import asyncio
+import base64
+import os
+import time
+
+import cv2
+import numpy as np
+
+# One interpreter, one admission slot and two queued requests: at most three
+# requests may be pending in the request threads
+os.environ.update({
+    'INFERENCE_BACKEND': 'stub',
+    'STUB_SERVICE_TIME_MS': '200',
+    'STUB_SERVICE_TIME_DISTRIBUTION': 'constant',
+    'INTERPRETER_POOL_SIZE': '1',
+    'BATCHING_ENABLED': 'false',
+    'ADMISSION_MAX_CONCURRENCY': '1',
+    'ADMISSION_MAX_QUEUE': '2',
+    'ASGI_WORKER_THREADS': '8',
+    'RESULT_CACHE_MAX_BYTES': '0',
+    'WARMUP_ITERATIONS': '0',
+    'PROBE_PORT': '0',
+})
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import asgi  # noqa: E402
+
+
+@pytest.fixture(scope='module', autouse=True)
+def model():
+    assert asgi.cloudpose.load_model()
+
+
+def random_image(seed):
+    image = np.random.default_rng(seed).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    return base64.b64encode(cv2.imencode('.jpg', image)[1]).decode('ascii')
+
+
+async def post_concurrently(count):
+    transport = httpx.ASGITransport(app=asgi.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test', timeout=30) as client:
+        async def post(i):
+            start = time.time()
+            response = await client.post('/api/pose_detection', json={'id': str(i), 'image': random_image(i)})
+            return response, time.time() - start
+        return await asyncio.gather(*(post(i) for i in range(count)))
+
+
+def test_overload_is_shed_before_the_request_threads():
+    results = asyncio.run(post_concurrently(30))
+
+    statuses = [response.status_code for response, _ in results]
+    assert set(statuses) <= {200, 429}
+    assert statuses.count(200) <= asgi.ASGI_MAX_PENDING
+    assert statuses.count(429) >= 30 - asgi.ASGI_MAX_PENDING
+    for response, _ in results:
+        if response.status_code == 429:
+            assert int(response.headers['Retry-After']) >= 1
+            assert response.json()['status'] == 'error'
+    # Admitted requests wait behind at most ASGI_MAX_PENDING - 1 others
+    assert max(latency for _, latency in results) < 0.2 * asgi.ASGI_MAX_PENDING + 1.0
+    assert asgi.pending_requests == 0
+
+
+def test_requests_within_the_limit_are_served():
+    results = asyncio.run(post_concurrently(asgi.ASGI_MAX_PENDING))
+
+    assert [response.status_code for response, _ in results] == [200] * asgi.ASGI_MAX_PENDING
+
+
+def test_shed_requests_are_not_read():
+    received = []
+    sent = []
+
+    async def receive():
+        received.append(True)
+        return {'type': 'http.request', 'body': b'{}', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/pose_detection', 'headers': []}
+    asgi.pending_requests = asgi.ASGI_MAX_PENDING
+    try:
+        asyncio.run(asgi.app(scope, receive, send))
+    finally:
+        asgi.pending_requests = 0
+
+    assert sent[0]['status'] == 429
+    assert not received
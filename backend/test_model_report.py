@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Checks how model_report selects kernel sets on each TFLite backend
+
+Run with: python -m pytest test_model_report.py
+"""
+
+import enum
+import types
+
+import pytest
+
+from model_report import BUILTIN, REFERENCE, XNNPACK, create_interpreter, model_report, op_resolver
+from runtime import Runtime, load_runtime
+
+
+class OpResolverType(enum.Enum):
+    AUTO = 0
+    BUILTIN = 1
+    BUILTIN_REF = 2
+    BUILTIN_WITHOUT_DEFAULT_DELEGATES = 3
+
+
+class RecordingInterpreter:
+    """Stands in for Interpreter and keeps the arguments it was created with"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+def runtime_like(name, module):
+    return Runtime(name, module, 'test', 0.0, 0)
+
+
+def litert_layout():
+    # ai_edge_litert.interpreter and tflite_runtime.interpreter
+    return types.SimpleNamespace(Interpreter=RecordingInterpreter, OpResolverType=OpResolverType)
+
+
+def tensorflow_layout():
+    # tensorflow.lite, with the enum under tf.lite.experimental
+    return types.SimpleNamespace(Interpreter=RecordingInterpreter,
+                                 experimental=types.SimpleNamespace(OpResolverType=OpResolverType))
+
+
+@pytest.mark.parametrize('name, module', [('litert', litert_layout()), ('tensorflow', tensorflow_layout())])
+def test_kernel_sets_select_the_resolver(name, module):
+    runtime = runtime_like(name, module)
+
+    assert 'experimental_op_resolver_type' not in create_interpreter(runtime, 'model.tflite', 2).kwargs
+    builtin = create_interpreter(runtime, 'model.tflite', 2, BUILTIN)
+    assert builtin.kwargs['experimental_op_resolver_type'] is OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    reference = create_interpreter(runtime, 'model.tflite', 2, REFERENCE)
+    assert reference.kwargs['experimental_op_resolver_type'] is OpResolverType.BUILTIN_REF
+
+
+@pytest.mark.parametrize('name', ['onnx', 'stub'])
+def test_non_tflite_runtimes_are_unsupported(name):
+    with pytest.raises(ValueError):
+        op_resolver(runtime_like(name, None), XNNPACK)
+
+
+def test_missing_resolver_is_unsupported():
+    runtime = runtime_like('tensorflow', types.SimpleNamespace(Interpreter=RecordingInterpreter))
+
+    assert op_resolver(runtime, XNNPACK) is None
+    with pytest.raises(ValueError, match='does not support selecting builtin kernels'):
+        model_report(runtime, 'model.tflite', kernel_sets=(XNNPACK, BUILTIN))
+
+
+def test_tensorflow_backend():
+    pytest.importorskip('tensorflow')
+    runtime = load_runtime('tensorflow')
+
+    assert op_resolver(runtime, BUILTIN).name == 'BUILTIN_WITHOUT_DEFAULT_DELEGATES'
+    assert op_resolver(runtime, REFERENCE).name == 'BUILTIN_REF'
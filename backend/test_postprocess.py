@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Checks the vectorized postprocessing against the per-keypoint loop it replaced
+
+Run with: python -m pytest test_postprocess.py
+"""
+
+import numpy as np
+import pytest
+
+from postprocess import keypoint_boxes, persons_from_keypoints
+
+SHAPES = [(480, 640), (1080, 1920), (256, 256), (33, 17)]
+
+
+def loop_persons(keypoints, height, width):
+    """The original keypoints_to_persons() loop (one image, keypoints as a 17x3 list)"""
+    persons = []
+    visible_points = []
+    confidence_scores = []
+    for kp in keypoints:
+        confidence = float(kp[2])
+        if confidence > 0.3:
+            visible_points.append((float(kp[1]) * width, float(kp[0]) * height))
+            confidence_scores.append(confidence)
+
+    if visible_points:
+        x_coords = [p[0] for p in visible_points]
+        y_coords = [p[1] for p in visible_points]
+        x_min = max(0, min(x_coords) - 20)
+        y_min = max(0, min(y_coords) - 20)
+        x_max = min(width, max(x_coords) + 20)
+        y_max = min(height, max(y_coords) + 20)
+        persons.append({
+            "box": {
+                "x": int(x_min),
+                "y": int(y_min),
+                "width": int(x_max - x_min),
+                "height": int(y_max - y_min),
+                "probability": float(np.mean(confidence_scores))
+            },
+            "keypoints": keypoints
+        })
+    return persons
+
+
+def random_keypoints(rng, count):
+    """Random MoveNet outputs with hidden, border and edge-clipped keypoints mixed in"""
+    keypoints = rng.random((count, 17, 3)).astype(np.float32)
+    # Images with no keypoint above the threshold
+    keypoints[::7, :, 2] *= 0.3
+    # float32(0.3) lies just above the 0.3 threshold and counts as visible
+    keypoints[1::5, :3, 2] = np.float32(0.3)
+    # Keypoints on or near the image border, so the margin is clipped
+    keypoints[2::3, 0, :2] = 0.0
+    keypoints[2::3, 1, :2] = 1.0
+    keypoints[3::4, 2, :2] = rng.uniform(0.97, 1.0, 2)
+    return keypoints
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_per_keypoint_loop(seed):
+    rng = np.random.default_rng(seed)
+    keypoints = random_keypoints(rng, 200)
+    shapes = [SHAPES[i % len(SHAPES)] for i in range(len(keypoints))]
+
+    results = persons_from_keypoints(keypoints, shapes)
+
+    assert len(results) == len(keypoints)
+    for image_keypoints, (height, width), persons in zip(keypoints, shapes, results):
+        expected = loop_persons(image_keypoints.tolist(), height, width)
+        assert len(persons) == len(expected)
+        for person, reference in zip(persons, expected):
+            box = dict(person['box'])
+            probability = box.pop('probability')
+            reference_box = dict(reference['box'])
+            assert box == {key: reference_box[key] for key in box}
+            assert probability == pytest.approx(reference_box['probability'], rel=1e-6)
+            np.testing.assert_array_equal(person['keypoints'], image_keypoints)
+
+
+def test_hidden_images_are_invalid():
+    keypoints = np.full((2, 17, 3), 0.5, dtype=np.float32)
+    keypoints[0, :, 2] = 0.25
+
+    boxes, probabilities, valid = keypoint_boxes(keypoints, [(100, 100)] * 2)
+
+    assert valid.tolist() == [False, True]
+    assert boxes[0].tolist() == [0, 0, 0, 0]
+    assert probabilities[0] == 0.0
+    assert boxes[1].tolist() == [30, 30, 70, 70]
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+CloudPose WSGI Entry Point
+
+Loads and warms up the model at import time. With gunicorn's preload_app
+(see gunicorn.conf.py) this happens once in the master process, and every
+forked worker starts with the model pages already in memory, shared
+copy-on-write instead of loaded again per worker.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import app as cloudpose
+from app import app, logger
+
+if not cloudpose.model_loaded:
+    logger.info("Starting CloudPose API server v2.0 (WSGI)...")
+    if cloudpose.load_model():
+        cloudpose.warm_up_model()
+    else:
+        logger.warning("Model loading failed, server will start but pose detection will not work")
@@ -27,6 +27,42 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def parse_server_timing(header):
+    """解析Server-Timing响应头，返回 {阶段: 耗时毫秒}"""
+    phases = {}
+    for metric in header.split(','):
+        name, _, params = metric.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if name and key == 'dur':
+                try:
+                    phases[name] = float(value)
+                except ValueError:
+                    pass
+    return phases
+
+def record_server_timing(environment, name, response, response_time):
+    """将服务端各阶段耗时记录为自定义指标（类型SERVER，名称为 "接口 阶段"）
+    
+    阶段包括 parse、queue、decode、pool、inference、render、serialize 和 total；
+    network 为客户端响应时间减去服务端总耗时（网络传输与连接排队），
+    这样每次实验的CSV都能区分网络/排队时间与计算时间。
+    注意SERVER条目也会计入Aggregated行，统计整体吞吐时请只看POST/GET条目。
+    """
+    phases = parse_server_timing(response.headers.get('Server-Timing', ''))
+    if 'total' in phases:
+        phases['network'] = max(0.0, response_time - phases['total'])
+    for phase, duration in phases.items():
+        environment.events.request.fire(
+            request_type="SERVER",
+            name=f"{name} {phase}",
+            response_time=duration,
+            response_length=0,
+            response=None,
+            context={},
+            exception=None
+        )
+
 class CloudPoseUser(HttpUser):
     """CloudPose API负载测试用户类"""
     
@@ -94,7 +130,9 @@ class CloudPoseUser(HttpUser):
         
         headers = {
             "Content-Type": "application/json",
-            "User-Agent": "Locust-CloudPose-Test"
+            "User-Agent": "Locust-CloudPose-Test",
+            # 与客户端超时一致，服务端超时后不再继续处理
+            "X-Request-Timeout": "30"
         }
         
         start_time = time.time()
@@ -116,6 +154,9 @@ class CloudPoseUser(HttpUser):
                                      'speed_inference', 'speed_postprocess']
                     
                     if all(field in result for field in required_fields):
+                        # 记录服务端分阶段耗时
+                        record_server_timing(self.environment, "/api/pose_detection", response, response_time)
+                        
                         # 记录性能指标
                         inference_time = result.get('speed_inference', 0) * 1000
                         total_processing_time = (result.get('speed_preprocess', 0) + 
@@ -158,7 +199,9 @@ class CloudPoseUser(HttpUser):
         
         headers = {
             "Content-Type": "application/json",
-            "User-Agent": "Locust-CloudPose-Test"
+            "User-Agent": "Locust-CloudPose-Test",
+            # 与客户端超时一致，服务端超时后不再继续处理
+            "X-Request-Timeout": "45"
         }
         
         start_time = time.time()
@@ -185,6 +228,10 @@ class CloudPoseUser(HttpUser):
                         if annotated_image and len(annotated_image) > 100:
                             response.success()
                             
+                            # 记录服务端分阶段耗时
+                            record_server_timing(self.environment, "/api/pose_estimation_image", response,
+                                                 response_time)
+                            
                             # 记录性能指标
                             inference_time = result.get('speed_inference', 0) * 1000
                             total_processing_time = (result.get('speed_preprocess', 0) + 
@@ -0,0 +1,58 @@
+"""Print the operator report of a .tflite model (the same one GET /debug/model returns)
+
+Shows which operators run on the XNNPACK delegate and which fall back to the
+builtin kernels, the tensor arena size, and invoke times per kernel set and
+thread count, e.g. to compare the lightning and thunder variants:
+
+    python op-profile.py movenet-full-256.tflite --threads 1,2,4
+    python op-profile.py movenet-lightning-192.tflite --kernels xnnpack,builtin,reference --ops
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+# The report lives with the service so both print the same thing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from model_report import BUILTIN, OP_RESOLVERS, XNNPACK, format_report, model_report  # noqa: E402
+from runtime import load_runtime  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Operator placement and invoke times of a TFLite model')
+    parser.add_argument('model', help='Path to a .tflite file')
+    parser.add_argument('--threads', default='1', help='Comma-separated interpreter thread counts (default: 1)')
+    parser.add_argument('--kernels', default=f'{XNNPACK},{BUILTIN}',
+                        help=f'Comma-separated kernel sets from {", ".join(OP_RESOLVERS)} (default: xnnpack,builtin)')
+    parser.add_argument('--iterations', type=int, default=50, help='Timed invokes per configuration')
+    parser.add_argument('--backend', default='auto', help='Inference backend (litert, tflite_runtime, tensorflow)')
+    parser.add_argument('--ops', action='store_true', help='List every operator and its kernels')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        parser.error(f"Model file not found: {args.model}")
+    kernel_sets = [k.strip() for k in args.kernels.split(',') if k.strip()]
+    unknown = [k for k in kernel_sets if k not in OP_RESOLVERS]
+    if unknown:
+        parser.error(f"Unknown kernels: {', '.join(unknown)}")
+
+    runtime = load_runtime(args.backend)
+    try:
+        report = model_report(runtime, args.model, [int(t) for t in args.threads.split(',')], kernel_sets,
+                              max(1, args.iterations))
+    except ValueError as e:
+        parser.exit(2, f"{parser.prog}: {e}\n")
+    if args.json:
+        if not args.ops:
+            report.pop('ops')
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report, show_ops=args.ops))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()